@@ -0,0 +1,75 @@
+"""
+Measures how long it takes to import each ftis module in a fresh interpreter and checks
+that none of the heavy optional dependencies are pulled in until they are first used.
+
+python benchmarks/imports.py --budget 1.5  # exits non-zero if a module is slow or eager
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+
+MODULES = [
+    "ftis.world",
+    "ftis.corpus",
+    "ftis.filters",
+    "ftis.index",
+    "ftis.analyser.audio",
+    "ftis.analyser.clustering",
+    "ftis.analyser.descriptor",
+    "ftis.analyser.dr",
+    "ftis.analyser.flucoma",
+    "ftis.analyser.meta",
+    "ftis.analyser.scaling",
+    "ftis.analyser.slicing",
+    "ftis.analyser.stats",
+]
+
+HEAVY = [
+    "umap",
+    "hdbscan",
+    "librosa",
+    "sklearn",
+    "scipy.signal",
+    "scipy.stats",
+    "numba",
+    "pynndescent",
+    "joblib",
+]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "eager": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(out.stdout.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark import time of ftis modules")
+    parser.add_argument("--budget", default=1.5, type=float, help="Maximum seconds allowed per import")
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        result = probe(module)
+        problems = []
+        if result["eager"]:
+            problems.append(f"imports {', '.join(result['eager'])}")
+        if result["seconds"] > args.budget:
+            problems.append("over budget")
+        failed = failed or bool(problems)
+        print(f"{module:<30} {result['seconds']:.3f}s {'; '.join(problems)}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,221 @@
+"""
+Benchmarks every analyser (and a representative World graph) against a synthetic corpus.
+Left out are the Dummy analyser used by the tests and LibroMFCC, which can not be constructed as
+it stands (its __init__ refers to an undefined discard) and never fills its output.
+
+Each graph is run twice in a fresh interpreter:
+cold - into an empty sink
+warm - again into the same sink with caching switched on
+
+python benchmarks/run.py --size 100 --output bench.json
+python benchmarks/run.py --size 100 --baseline bench.json  # exits non-zero on regressions
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from multiprocessing import get_context
+from pathlib import Path
+from rich.console import Console
+from rich.table import Table
+from rich import box
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic import make_corpus, total_duration
+
+FEATURES = [
+    ("ftis.analyser.audio", "CollapseAudio", {}),
+    ("ftis.analyser.flucoma", "MFCC", {}),
+    ("ftis.analyser.stats", "Stats", {}),
+]
+
+GRAPHS = {
+    "CollapseAudio": [("ftis.analyser.audio", "CollapseAudio", {})],
+    "ExplodeAudio": [
+        ("ftis.analyser.slicing", "FluidNoveltyslice", {"threshold": 0.3}),
+        ("ftis.analyser.audio", "ExplodeAudio", {}),
+    ],
+    "Duration": [("ftis.filters", "Duration", {})],
+    "FilterLoudness": [("ftis.filters", "Loudness", {})],
+    "Loudness": [("ftis.analyser.flucoma", "Loudness", {})],
+    "Pitch": [("ftis.analyser.flucoma", "Pitch", {})],
+    "MFCC": [("ftis.analyser.flucoma", "MFCC", {})],
+    "FluidOnsetslice": [("ftis.analyser.slicing", "FluidOnsetslice", {})],
+    "FluidNoveltyslice": [("ftis.analyser.slicing", "FluidNoveltyslice", {})],
+    "Onsetslice": [("ftis.analyser.flucoma", "Onsetslice", {})],
+    "Noveltyslice": [("ftis.analyser.flucoma", "Noveltyslice", {})],
+    "Flux": [("ftis.analyser.descriptor", "Flux", {})],
+    "Chroma": [("ftis.analyser.descriptor", "Chroma", {})],
+    "LibroCQT": [("ftis.analyser.descriptor", "LibroCQT", {})],
+    "Stats": FEATURES,
+    "Normalise": FEATURES + [("ftis.analyser.scaling", "Normalise", {})],
+    "Standardise": FEATURES + [("ftis.analyser.scaling", "Standardise", {})],
+    "UMAP": FEATURES + [("ftis.analyser.dr", "UMAP", {})],
+    "AgglomerativeClustering": FEATURES + [("ftis.analyser.clustering", "AgglomerativeClustering", {})],
+    "HDBSCAN": FEATURES + [("ftis.analyser.clustering", "HDBSCAN", {})],
+    "MiniBatchKMeans": FEATURES + [("ftis.analyser.clustering", "MiniBatchKMeans", {})],
+    "KDTree": FEATURES + [("ftis.analyser.clustering", "KDTree", {})],
+    "ClusteredNMF": [("ftis.analyser.meta", "ClusteredNMF", {"iterations": 10})],
+    "ClusteredSegmentation": [
+        ("ftis.analyser.slicing", "FluidNoveltyslice", {"threshold": 0.3}),
+        ("ftis.analyser.meta", "ClusteredSegmentation", {}),
+    ],
+    "World": FEATURES
+    + [
+        ("ftis.analyser.scaling", "Standardise", {}),
+        ("ftis.analyser.dr", "UMAP", {}),
+        ("ftis.analyser.clustering", "HDBSCAN", {}),
+    ],
+}
+
+
+def measure(name: str, corpus: str, sink: str) -> dict:
+    """Build and run one graph, returning its timings. Runs in a fresh interpreter."""
+    from ftis.world import World
+    from ftis.corpus import Corpus
+    from ftis.common.io import read_json
+    from ftis.common.profile import peak_rss
+
+    world = World(sink=sink, quiet=True)
+    src = Corpus(corpus)
+    node = src
+    for module, cls, params in GRAPHS[name]:
+        node = node >> getattr(import_module(module), cls)(cache=True, **params)
+
+    start = time.perf_counter()
+    try:
+        world.build(src)
+        world.run()
+    except Exception as e:
+        return {"error": f"{e.__class__.__name__}: {e}"}
+    wall = time.perf_counter() - start
+
+    profile = read_json(world.metapath)["profile"].values()
+    ratios = [p["microcache_hit_ratio"] for p in profile if p["microcache_hit_ratio"] is not None]
+    return {
+        "wall": wall,
+        "peak_rss": peak_rss(),
+        "cached_nodes": sum(p["cached"] for p in profile) / max(len(profile), 1),
+        "microcache_hit_ratio": sum(ratios) / len(ratios) if ratios else None,
+        "nodes": {p["name"]: p["phases"] for p in profile},
+    }
+
+
+def isolated(name: str, corpus: Path, sink: Path) -> dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(measure, name, str(corpus), str(sink)).result()
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Throughput or memory regressions beyond tolerance relative to a saved baseline"""
+    regressions = []
+    for name, modes in results.items():
+        for mode, current in modes.items():
+            try:
+                before = baseline["graphs"][name][mode]
+            except KeyError:
+                continue
+            if "error" in current or "error" in before:
+                if "error" in current and "error" not in before:
+                    regressions.append(f"{name} ({mode}) now fails: {current['error']}")
+                continue
+            if current["files_per_second"] < before["files_per_second"] * (1 - tolerance):
+                regressions.append(
+                    f"{name} ({mode}) throughput {current['files_per_second']:.2f} files/s "
+                    f"was {before['files_per_second']:.2f}"
+                )
+            if current["peak_rss"] > before["peak_rss"] * (1 + tolerance):
+                regressions.append(
+                    f"{name} ({mode}) peak rss {current['peak_rss'] / 1e6:.1f}MB "
+                    f"was {before['peak_rss'] / 1e6:.1f}MB"
+                )
+    return regressions
+
+
+def report(results: dict, console: Console) -> None:
+    table = Table(title="Benchmarks", box=box.HORIZONTALS)
+    for column in (
+        "Graph",
+        "Mode",
+        "Wall (s)",
+        "Files/s",
+        "Audio s/s",
+        "Peak RSS (MB)",
+        "Cached",
+        "Microcache",
+    ):
+        table.add_column(column)
+    for name, modes in results.items():
+        for mode, r in modes.items():
+            if "error" in r:
+                table.add_row(name, mode, f"[red]{r['error']}", "", "", "", "", "")
+                continue
+            ratio = r["microcache_hit_ratio"]
+            table.add_row(
+                name,
+                mode,
+                f"{r['wall']:.2f}",
+                f"{r['files_per_second']:.2f}",
+                f"{r['audio_seconds_per_second']:.1f}",
+                f"{r['peak_rss'] / 1e6:.1f}",
+                f"{r['cached_nodes']:.0%}",
+                "-" if ratio is None else f"{ratio:.0%}",
+            )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    from ftis.common.io import write_json, read_json
+
+    parser = argparse.ArgumentParser(description="Benchmark ftis analysers on a synthetic corpus")
+    parser.add_argument("--size", default=50, type=int, help="Number of files in the corpus")
+    parser.add_argument("--channels", default=1, type=int)
+    parser.add_argument("--min-duration", default=0.5, type=float)
+    parser.add_argument("--max-duration", default=5.0, type=float)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--graphs", nargs="*", default=list(GRAPHS), help="Graphs to run")
+    parser.add_argument("--workdir", default=None, type=str, help="Where corpora and sinks are made")
+    parser.add_argument("--output", default=None, type=str, help="Write results to this JSON file")
+    parser.add_argument("--baseline", default=None, type=str, help="Compare against a previous output")
+    parser.add_argument("--tolerance", default=0.1, type=float, help="Allowed fractional regression")
+    args = parser.parse_args()
+
+    console = Console()
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="ftis-bench-")).expanduser().resolve()
+    corpus = make_corpus(
+        workdir / f"corpus-{args.size}-{args.channels}-{args.seed}",
+        size=args.size,
+        channels=args.channels,
+        min_duration=args.min_duration,
+        max_duration=args.max_duration,
+        seed=args.seed,
+    )
+    seconds = total_duration(corpus)
+
+    results = {}
+    for name in args.graphs:
+        sink = Path(tempfile.mkdtemp(prefix=f"{name}-", dir=workdir))
+        results[name] = {}
+        for mode in ("cold", "warm"):
+            r = isolated(name, corpus, sink)
+            if "error" not in r:
+                r["files_per_second"] = args.size / r["wall"]
+                r["audio_seconds_per_second"] = seconds / r["wall"]
+            results[name][mode] = r
+
+    report(results, console)
+    settings = {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "workdir")}
+    if args.output:
+        write_json(args.output, {"settings": settings, "graphs": results})
+
+    if args.baseline:
+        baseline = read_json(args.baseline)
+        if baseline["settings"] != settings:
+            console.print("[yellow]Baseline was recorded with different settings")
+        regressions = compare(results, baseline, args.tolerance)
+        for r in regressions:
+            console.print(f"[red]{r}")
+        sys.exit(1 if regressions else 0)
@@ -1,3 +1,4 @@
+import os
 from ftis.common.analyser import FTISAnalyser
 from ftis.common.io import write_json, read_json, peek, get_sr
 from ftis.common.proc import singleproc
@@ -11,27 +12,56 @@ class CollapseAudio(FTISAnalyser):
     def __init__(self, cache=False):
         super().__init__(cache=cache)
 
+    def folder(self) -> Path:
+        if self.process.store is not None:
+            # Identical collapses from any sink share a folder, so the nodes after this one can be shared too
+            return self.process.store.folder(self.identity["hash"])
+        return self.process.sink / f"{self.order}.{self.suborder}-{self.parent_string}"
+
+    def destination(self, workable) -> Path:
+        return self.outfolder / Path(workable).name
+
+    def rename_aliases(self, aliases: dict) -> dict:
+        """Nodes after this one see the collapsed copies, so their duplicates are named the same way"""
+        folder = self.folder()
+        return {
+            str(folder / Path(k).name): [str(folder / Path(a).name) for a in group]
+            for k, group in aliases.items()
+        }
+
+    def is_stale(self, workable) -> bool:
+        """Collapsed files are kept between runs and only redone when the source is newer"""
+        out = self.destination(workable)
+        return not out.exists() or out.stat().st_mtime < Path(workable).stat().st_mtime
+
+    def load(self, workable):
+        return sf.read(workable, dtype="float32")
+
     def collapse(self, workable):
-        out = self.outfolder / Path(workable).name
-        raw, sr = sf.read(workable, dtype="float32")
+        out = self.destination(workable)
+        raw, sr = self.read(workable)
         audio = None
         if raw.ndim == 1:
             audio = raw
         else:
             audio = raw.transpose().sum(axis=0) / raw.ndim
-        sf.write(out, audio, sr, "PCM_32")
+        tmp = out.with_name(f".{out.stem}.{os.getpid()}{out.suffix}")  # other worlds may read the folder
+        sf.write(tmp, audio, sr, "PCM_32")
+        os.replace(tmp, out)
 
     def run(self):
-        self.outfolder = (
-            self.process.sink / 
-            f"{self.order}.{self.suborder}-{self.parent_string}"
-        )
+        self.outfolder = self.folder()
         self.outfolder.mkdir(exist_ok=True)
-        singleproc(self.name, self.collapse, self.input)
-        self.output = AudioFiles([x for x in self.outfolder.iterdir()])
+        stale = [x for x in self.input if self.is_stale(x)]
+        if stale:
+            singleproc(self.name, self.collapse, stale)
+        self.fresh = [str(self.destination(x)) for x in stale]
+        self.output = AudioFiles([self.destination(x) for x in self.input])
 
 
 class ExplodeAudio(FTISAnalyser):
+    shareable = False
+
     def __init__(self, cache=False):
         super().__init__(cache=cache)
         self.dump_type = ".json"
@@ -64,6 +94,7 @@ class ExplodeAudio(FTISAnalyser):
                 segment = data[start:end]
                 output_location = self.outfolder / f"{stem}_{i}.wav"
                 sf.write(output_location, segment, sr, "PCM_32")
+        self.buffer[workable] = len(slices)
 
     def run(self):
         self.outfolder = (
@@ -71,5 +102,8 @@ class ExplodeAudio(FTISAnalyser):
             f"{self.order}.{self.suborder}-{self.parent_string}"
         )
         self.outfolder.mkdir(exist_ok=True)
-        singleproc(self.name, self.segment, self.input)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            singleproc(self.name, self.segment, workables)
         self.output = [str(x) for x in self.outfolder.iterdir()]
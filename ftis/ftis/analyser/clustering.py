@@ -1,17 +1,83 @@
 from ftis.common.analyser import FTISAnalyser
 from ftis.common.proc import staticproc
 from ftis.common.io import write_json, read_json
-from sklearn.neighbors import KDTree as SKKDTree
-from sklearn.cluster import AgglomerativeClustering as AggCluster
-from joblib import dump as jdump
+from ftis.common.utils import create_hash, fingerprint, diff
+from ftis.index import NeighbourIndex
 import numpy as np
-import hdbscan
+
+
+def format_labels(keys, labels, compact=False) -> dict:
+    """Either group keys by cluster or store one integer label per key"""
+    if compact:
+        return {"keys": [str(x) for x in keys], "labels": [int(x) for x in labels]}
+
+    output = {}
+    for audio, cluster in zip(keys, labels):
+        if str(cluster) in output:
+            output[str(cluster)].append(audio)
+        else:
+            output[str(cluster)] = [audio]
+    return output
+
+
+def summarise_labels(output: dict) -> dict:
+    """The number of clusters, the size of the largest and how many items were left as noise (-1)"""
+    if set(output) == {"keys", "labels"}:
+        labels = [str(x) for x in output["labels"]]
+        sizes = {label: labels.count(label) for label in set(labels)}
+    else:
+        sizes = {label: len(members) for label, members in output.items()}
+    noise = sizes.pop("-1", 0)
+    return {"clusters": len(sizes), "largest": max(sizes.values(), default=0), "noise": noise}
 
 
 class AgglomerativeClustering(FTISAnalyser):
-    def __init__(self, numclusters=3, cache=False):
+    def __init__(self, numclusters=3, neighbours=None, linkage="ward", compact=False, cache=False):
+        super().__init__(cache=cache)
+        self.numclusters = numclusters
+        self.neighbours = neighbours  # constrain merges to a kNN graph of this many neighbours
+        self.linkage = linkage
+        self.compact = compact
+
+    def load_cache(self):
+        self.output = read_json(self.dump_path)
+
+    def dump(self):
+        write_json(self.dump_path, self.output)
+
+    def analyse(self):
+        from sklearn.cluster import AgglomerativeClustering as AggCluster
+
+        keys = [x for x in self.input.keys()]
+        values = [x for x in self.input.values()]
+
+        data = np.array(values, dtype=np.float32)
+
+        connectivity = None
+        if self.neighbours:
+            connectivity = self.neighbour_graph(data, self.neighbours + 1).connectivity(self.neighbours)
+
+        db = AggCluster(n_clusters=self.numclusters, connectivity=connectivity, linkage=self.linkage)
+        db.fit(data)
+
+        self.output = format_labels(keys, db.labels_, self.compact)
+
+    def summary(self) -> dict:
+        return summarise_labels(self.output)
+
+    def run(self):
+        staticproc(self.name, self.analyse)
+
+
+class MiniBatchKMeans(FTISAnalyser):
+    """A fast alternative to agglomerative clustering for large corpora"""
+
+    def __init__(self, numclusters=3, batchsize=1024, iterations=100, compact=False, cache=False):
         super().__init__(cache=cache)
         self.numclusters = numclusters
+        self.batchsize = batchsize
+        self.iterations = iterations
+        self.compact = compact
 
     def load_cache(self):
         self.output = read_json(self.dump_path)
@@ -20,30 +86,45 @@ class AgglomerativeClustering(FTISAnalyser):
         write_json(self.dump_path, self.output)
 
     def analyse(self):
+        from sklearn.cluster import MiniBatchKMeans as MBKMeans
+
         keys = [x for x in self.input.keys()]
         values = [x for x in self.input.values()]
 
-        data = np.array(values)
+        data = np.array(values, dtype=np.float32)
 
-        db = AggCluster(n_clusters=self.numclusters).fit(data)
+        db = MBKMeans(
+            n_clusters=self.numclusters, batch_size=self.batchsize, max_iter=self.iterations, random_state=42
+        ).fit(data)
 
-        self.output = {}
+        self.output = format_labels(keys, db.labels_, self.compact)
 
-        for audio, cluster in zip(keys, db.labels_):
-            if str(cluster) in self.output:
-                self.output[str(cluster)].append(audio)
-            else:
-                self.output[str(cluster)] = [audio]
+    def summary(self) -> dict:
+        return summarise_labels(self.output)
 
     def run(self):
         staticproc(self.name, self.analyse)
 
 
 class HDBSCAN(FTISAnalyser):
-    def __init__(self, minclustersize=2, minsamples=1, cache=False):
+    def __init__(
+        self,
+        minclustersize=2,
+        minsamples=1,
+        algorithm="best",
+        leafsize=40,
+        jobs=4,
+        compact=False,
+        cache=False,
+    ):
         super().__init__(cache=cache)
         self.minclustersize = minclustersize
         self.minsamples = minsamples
+        # "boruvka_kdtree" computes core distances from a prebuilt tree, "graph" uses the shared kNN graph
+        self.algorithm = algorithm
+        self.leafsize = leafsize
+        self.jobs = jobs
+        self.compact = compact
         self.dump_type = ".json"
 
     def load_cache(self):
@@ -53,40 +134,118 @@ class HDBSCAN(FTISAnalyser):
         write_json(self.dump_path, self.output)
 
     def analyse(self):
+        import hdbscan
+
         keys = [x for x in self.input.keys()]
         values = [x for x in self.input.values()]
 
-        data = np.array(values)
+        data = np.array(values, dtype=np.float32)
 
-        db = hdbscan.HDBSCAN(
-            min_cluster_size=self.minclustersize,
-            min_samples=self.minsamples,
-        ).fit(data)
+        if self.algorithm == "graph":
+            db = self.fit_graph(data)
+        else:
+            db = hdbscan.HDBSCAN(
+                min_cluster_size=self.minclustersize,
+                min_samples=self.minsamples,
+                algorithm=self.algorithm,
+                leaf_size=self.leafsize,
+                core_dist_n_jobs=self.jobs,
+            ).fit(data)
 
-        self.output = {}
+        self.output = format_labels(keys, db.labels_, self.compact)
 
-        for audio, cluster in zip(keys, db.labels_):
-            if str(cluster) in self.output:
-                self.output[str(cluster)].append(audio)
-            else:
-                self.output[str(cluster)] = [audio]
+    def summary(self) -> dict:
+        return summarise_labels(self.output)
 
     def run(self):
         staticproc(self.name, self.analyse)
 
+    def fit_graph(self, data):
+        """Cluster on the sparse distances of the shared kNN graph, falling back to all distances if it is disconnected"""
+        import hdbscan
+        from scipy.sparse.csgraph import connected_components
+
+        k = max(self.minsamples, self.minclustersize, 15)
+        distances = self.neighbour_graph(data, k + 1).sparse(k)
+        distances = distances.maximum(distances.T)
+        if connected_components(distances, directed=False)[0] > 1:
+            self.log("kNN graph is disconnected, using the full distances")
+            return hdbscan.HDBSCAN(
+                min_cluster_size=self.minclustersize,
+                min_samples=self.minsamples,
+                leaf_size=self.leafsize,
+                core_dist_n_jobs=self.jobs,
+            ).fit(data)
+        return hdbscan.HDBSCAN(
+            min_cluster_size=self.minclustersize,
+            min_samples=self.minsamples,
+            metric="precomputed",
+        ).fit(distances)
+
 
 class KDTree(FTISAnalyser):
-    def __init__(self, cache=False):
+    """Builds a persistent neighbour index that can be queried by key"""
+
+    def __init__(self, approximate=False, leafsize=40, incremental=False, threshold=0.1, cache=False):
         super().__init__(cache=cache)
+        self.approximate = approximate
+        self.leafsize = leafsize
+        self.incremental = incremental  # update the persisted index with the keys that changed
+        self.threshold = threshold  # share of unbalanced rows before the tree is rebuilt
+        self.model = None
+
+    def cache_exists(self) -> bool:
+        return self.model_dump.exists()
+
+    def load_cache(self):
+        self.model = NeighbourIndex.load(self.model_dump)
+        self.output = self.model_dump
 
     def dump(self):
-        jdump(self.model, self.model_dump)
+        self.model.save(self.model_dump)
+        if self.incremental:
+            write_json(self.model_meta, self.meta)
+
+    def query(self, points, k=1) -> list:
+        return self.model.query(points, k)
+
+    def radius(self, points, radius) -> list:
+        return self.model.radius(points, radius)
+
+    def model_params(self) -> str:
+        return create_hash(self.approximate, self.leafsize)
+
+    def update(self) -> bool:
+        """Apply the difference between this input and the last one to the persisted index"""
+        if not self.model_dump.exists() or not self.model_meta.exists():
+            return False
+        meta = read_json(self.model_meta)
+        if meta["params"] != self.model_params():
+            return False
+
+        self.model = NeighbourIndex.load(self.model_dump)
+        self.model.threshold = self.threshold
+        added, removed, changed = diff(meta["seen"], self.meta["seen"])
+        self.model.remove(removed)
+        if added or changed:
+            self.model.add(added + changed, [self.input[k] for k in added + changed])
+        return True
 
     def analyse(self):
-        data = [v for v in self.input.values()]
+        self.meta = {"params": self.model_params(), "seen": fingerprint(self.input)}
+        if self.incremental and self.update():
+            return
+
         keys = [k for k in self.input.keys()]
-        data = np.array(data)
-        self.model = SKKDTree(data)
+        data = np.array([v for v in self.input.values()], dtype=np.float32)
+        self.model = NeighbourIndex(
+            keys,
+            data,
+            approximate=self.approximate,
+            leafsize=self.leafsize,
+            threshold=self.threshold,
+            graph=self.neighbour_graph(data, 31) if self.approximate else None,
+        )
 
     def run(self):
         staticproc(self.name, self.analyse)
@@ -1,46 +1,87 @@
 from ftis.common.analyser import FTISAnalyser
 from ftis.common.proc import staticproc, multiproc, singleproc
 from ftis.common.io import write_json, read_json
-from ftis.common.utils import create_hash
-from ftis.common.types import AudioFiles, Indices, Data
-from multiprocessing import Manager
+from ftis.common.types import AudioFiles, Indices, Data, FeatureStore
 from ftis.common.io import get_sr
+from ftis.common.chunking import gather
+import soundfile as sf
 import numpy as np
-import librosa
 
 class Flux(FTISAnalyser):
+    itemwise = True
+    stream_method = "flux"
+    dump_type = ".npz"
+
     def __init__(self, windowsize=1024, hopsize=512, cache=False):
         super().__init__(cache=cache)
         self.windowsize = windowsize
         self.hopsize = hopsize
 
     def load_cache(self):
-        self.output = read_json(self.dump_path)
+        self.output = FeatureStore.load(self.dump_path)
 
     def dump(self):
-        write_json(self.dump_path, self.output)
+        self.output.save(self.dump_path)
+
+    def collect(self, results):
+        return FeatureStore(results)
+
+    @staticmethod
+    def whole(workable) -> dict:
+        return {"file": str(workable), "id": str(workable), "startframe": 0, "numframes": -1}
+
+    def adapt_input(self):
+        self.workables = [self.whole(x) for x in self.input]
+        # librosa.stft uses a 2048 sample fft whatever the window
+        self.workables = self.split_workables(self.workables, self.hopsize, max(self.windowsize, 2048))
+
+    def load(self, workable):
+        import librosa
+
+        if not isinstance(workable, dict):
+            workable = self.whole(workable)
+        if self.microcache_path(workable).exists():
+            return None
+        if "parent" in workable:
+            y, sr = sf.read(
+                workable["file"],
+                start=workable["startframe"],
+                stop=workable["startframe"] + workable["numframes"],
+                dtype="float32",
+            )
+            return (y.mean(axis=1) if y.ndim > 1 else y), sr
+        sr = get_sr(workable["file"])
+        y, _ = librosa.load(workable["file"], sr=sr)
+        return y, sr
 
     def flux(self, workable):
-        hsh = create_hash(workable, self.identity)
-        cache = self.process.cache / f"{hsh}.npy"
+        import librosa
+
+        if not isinstance(workable, dict):  # a single key when streaming
+            workable = self.whole(workable)
+        cache = self.microcache(workable)
 
         if not cache.exists():
-            sr = get_sr(workable)
-            y, _ = librosa.load(workable, sr=sr)
+            y, sr = self.read(workable)
             fft = librosa.stft(y, win_length=self.windowsize, hop_length=self.hopsize)
             flux = np.sum(np.abs(np.diff(np.abs(fft))), axis=0)
             np.save(cache, flux)
         else:
             flux = np.load(cache)
-        self.buffer[workable] = flux.tolist()
+        self.buffer[workable["id"]] = flux.astype(np.float32)
     
     def run(self):
-        self.buffer = Manager().dict()
-        singleproc(self.name, self.flux, self.input)
-        self.output = dict(self.buffer)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.workables, key=self.workable_key)
+        if workables:
+            multiproc(self.name, self.flux, workables)
+        self.output = self.collect(gather(dict(self.buffer), self.workables))
 
 
 class Chroma(FTISAnalyser):
+    itemwise = True
+    stream_method = "chroma"
+
     def __init__(self, 
     numchroma=12,
     numoctaves=7,
@@ -54,30 +95,43 @@ class Chroma(FTISAnalyser):
         self.fmin = fmin
         self.numoctaves = numoctaves
         self.bins_per_octave = bins_per_octave
-        self.dump_type = ".json"
+        self.dump_type = ".npz"
 
     def load_cache(self):
-        self.output = read_json(self.dump_path)
+        self.output = FeatureStore.load(self.dump_path)
 
     def dump(self):
-        write_json(self.dump_path, self.output)
+        self.output.save(self.dump_path)
+
+    def collect(self, results):
+        return FeatureStore(results)
+
+    def load(self, workable):
+        import librosa
+
+        if self.microcache_path(workable).exists():
+            return None
+        return librosa.load(workable)
 
     def chroma(self, workable):
-        hsh = create_hash(workable, self.identity)
-        cache = self.process.cache / f"{hsh}.npy"
+        import librosa
+
+        cache = self.microcache(workable)
 
         if not cache.exists():
-            y, sr = librosa.load(workable)
+            y, sr = self.read(workable)
             chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
             np.save(cache, chroma)
         else:
             chroma = np.load(cache)
-        self.buffer[str(workable)] = chroma.tolist()
+        self.buffer[str(workable)] = chroma.astype(np.float32)
 
     def run(self):
-        self.buffer = Manager().dict()
-        multiproc(self.name, self.chroma, self.input)
-        self.output = dict(self.buffer)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            multiproc(self.name, self.chroma, workables)
+        self.output = self.collect(dict(self.buffer))
 
 
 class LibroMFCC(FTISAnalyser):
@@ -110,8 +164,9 @@ class LibroMFCC(FTISAnalyser):
         write_json(self.dump_path, self.output)
 
     def analyse(self, workable):
-        hsh = create_hash(workable, self.identity)
-        cache = self.process.cache / f"{hsh}.npy"
+        import librosa
+
+        cache = self.microcache(workable)
         if cache.exists():
             feature = np.load(cache, allow_pickle=True)
             print("loaded cache")
@@ -131,12 +186,17 @@ class LibroMFCC(FTISAnalyser):
             np.save(cache, feature)
 
     def run(self):
-        self.buffer = Manager().dict()
-        singleproc(self.name, self.analyse, self.input)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            singleproc(self.name, self.analyse, workables)
         self.output = dict(self.buffer)
 
 
 class LibroCQT(FTISAnalyser):
+    itemwise = True
+    stream_method = "analyse"
+
     def __init__(
         self,
         hop_length=512,
@@ -164,21 +224,32 @@ class LibroCQT(FTISAnalyser):
         self.window = window
         self.scale = scale
         self.pad_mode = pad_mode
-        self.dump_type = ".json"
+        self.dump_type = ".npz"
 
     def load_cache(self):
-        self.output = read_json(self.dump_path)
+        self.output = FeatureStore.load(self.dump_path)
 
     def dump(self):
-        write_json(self.dump_path, self.output)
+        self.output.save(self.dump_path)
+
+    def collect(self, results):
+        return FeatureStore(results)
+
+    def load(self, workable):
+        import librosa
+
+        if self.microcache_path(workable).exists():
+            return None
+        return librosa.load(workable, sr=None, mono=True)
 
     def analyse(self, workable):
-        hsh = create_hash(workable, self.identity)
-        cache = self.process.cache / f"{hsh}.npy"
+        import librosa
+
+        cache = self.microcache(workable)
         if cache.exists():
             cqt = np.load(cache, allow_pickle=True)
         else:
-            y, sr = librosa.load(workable, sr=None, mono=True)
+            y, sr = self.read(workable)
             cqt = librosa.cqt(y, sr,
                 fmin=self.minfreq,
                 n_bins=self.n_bins,
@@ -193,9 +264,11 @@ class LibroCQT(FTISAnalyser):
             )
             np.save(cache, cqt)
 
-        self.buffer[str(workable)] = np.abs(cqt).tolist()
+        self.buffer[str(workable)] = np.abs(cqt).astype(np.float32)
 
     def run(self):
-        self.buffer = Manager().dict()
-        singleproc(self.name, self.analyse, self.input)
-        self.output = dict(self.buffer)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            singleproc(self.name, self.analyse, workables)
+        self.output = self.collect(dict(self.buffer))
@@ -1,48 +1,123 @@
 from ftis.common.analyser import FTISAnalyser
 from ftis.common.io import write_json, read_json
 from ftis.common.proc import staticproc
+from ftis.common.utils import create_hash, fingerprint
 from ftis.common.types import Data
-from umap import UMAP as umapdr
-from joblib import dump as jdump
 import numpy as np
 
 
 class UMAP(FTISAnalyser):
     """Dimension reduction with UMAP algorithm"""
 
-    def __init__(self, mindist=0.01, neighbours=7, components=2, cache=False):
+    def __init__(self,
+        mindist=0.01,
+        neighbours=7,
+        components=2,
+        incremental=False,
+        refit=False,
+        drift=0.2,
+        fitsize=None,
+        batchsize=10000,
+        shared_knn=False,
+        cache=False
+    ):
         super().__init__(cache=cache)
         self.mindist = mindist
         self.neighbours = neighbours
         self.components = components
+        self.incremental = incremental # transform new items against the persisted model
+        self.refit = refit # force a refit even if a persisted model could be used
+        self.drift = drift # fraction of items unseen by the model before refitting
+        self.fitsize = fitsize # fit on a subsample of this many items and transform the rest
+        self.batchsize = batchsize
+        self.shared_knn = shared_knn # reuse the kNN graph of other nodes, the model then can not transform
+        self.model = None
         self.output = {}
 
     def load_cache(self):
         self.output = read_json(self.dump_path)
 
     def dump(self):
-        jdump(self.model, self.model_dump)
+        if self.model is not None:
+            from joblib import dump as jdump
+
+            jdump(self.model, self.model_dump)
+            write_json(self.model_meta, self.meta)
         write_json(self.dump_path, self.output)
 
-    def analyse(self):
-        data = [v for v in self.input.values()]
-        data = np.array(data)
+    def model_params(self) -> str:
+        return create_hash(self.mindist, self.neighbours, self.components, self.fitsize)
+
+    def load_model(self) -> bool:
+        """Restore the persisted model if it was fitted with the same parameters"""
+        if self.refit or not self.model_dump.exists() or not self.model_meta.exists() or not self.dump_path.exists():
+            return False
+        meta = read_json(self.model_meta)
+        if meta["params"] != self.model_params() or meta.get("precomputed"):
+            return False
+        from joblib import load as jload
+
+        self.model = jload(self.model_dump)
+        self.meta = meta
+        return True
+
+    def transform(self, keys) -> dict:
+        transformed = {}
+        for i in range(0, len(keys), self.batchsize):
+            batch = keys[i : i + self.batchsize]
+            data = np.array([self.input[k] for k in batch])
+            for k, v in zip(batch, self.model.transform(data)):
+                transformed[k] = v.tolist()
+        return transformed
+
+    def fit(self, keys) -> dict:
+        from umap import UMAP as umapdr
 
+        fitted = keys
+        if self.fitsize and len(keys) > self.fitsize:
+            rng = np.random.default_rng(42)
+            fitted = [keys[i] for i in sorted(rng.choice(len(keys), self.fitsize, replace=False))]
+
+        data = np.array([self.input[k] for k in fitted])
+        knn = (None, None, None)
+        if self.shared_knn and len(fitted) == len(keys) and not self.incremental:
+            # A model fitted on a precomputed graph has no search index, so it can not transform new items
+            knn = (*self.neighbour_graph(data, self.neighbours).knn(self.neighbours), None)
         self.model = umapdr(
-            n_components=self.components, 
-            n_neighbors=self.neighbours, 
-            min_dist=self.mindist, 
-            random_state=42
+            n_components=self.components,
+            n_neighbors=self.neighbours,
+            min_dist=self.mindist,
+            random_state=42,
+            precomputed_knn=knn,
         )
-        self.model.fit(data)
-        transformed_data = self.model.transform(data)
-        self.output = {
-            k: v.tolist() 
-            for k, v in zip(
-                self.input.keys(), 
-                transformed_data
-            )
-        }
+        transformed = {k: v.tolist() for k, v in zip(fitted, self.model.fit_transform(data))}
+        if len(fitted) != len(keys):
+            transformed.update(self.transform([k for k in keys if k not in transformed]))
+        self.meta["fitted"] = {k: self.fingerprints[k] for k in fitted}
+        self.meta["precomputed"] = knn[0] is not None
+        return transformed
+
+    def analyse(self):
+        keys = [k for k in self.input.keys()]
+        self.fingerprints = fingerprint(self.input)
+
+        if self.incremental and self.load_model():
+            fitted = self.meta["fitted"]
+            unseen = [k for k in keys if fitted.get(k) != self.fingerprints[k]]
+            if len(unseen) <= self.drift * len(keys):
+                previous = read_json(self.dump_path)
+                seen = self.meta["seen"]
+                stale = [k for k in keys if seen.get(k) != self.fingerprints[k] or k not in previous]
+                transformed = {k: previous[k] for k in keys if k in previous}
+                transformed.update(self.transform(stale))
+            else:
+                transformed = self.fit(keys)
+        else:
+            self.meta = {"params": self.model_params()}
+            transformed = self.fit(keys)
+
+        self.meta["seen"] = self.fingerprints
+        self.output = {k: transformed[k] for k in keys}
 
     def run(self):
         staticproc(self.name, self.analyse)
@@ -1,14 +1,16 @@
 from ftis.common.analyser import FTISAnalyser
+from ftis.common.prefetch import warm
 from ftis.common.io import write_json, read_json, get_sr
 from ftis.common.proc import multiproc, singleproc
-from ftis.common.utils import create_hash
-from ftis.common.types import Indices, AudioFiles, Data
-from multiprocessing import Manager
+from ftis.common.types import Indices, AudioFiles, Data, FeatureStore
+from ftis.common.chunking import gather
 from flucoma.utils import get_buffer
 from flucoma import fluid
 import numpy as np
 
 class Loudness(FTISAnalyser):
+    dump_type = ".npz"
+
     def __init__(self, windowsize=17640, hopsize=4410, kweighting=1, truepeak=1, 
         cache=False,
         pre=None,
@@ -16,21 +18,27 @@ class Loudness(FTISAnalyser):
      ):
         super().__init__(cache=cache, pre=pre, post=post)
         self.input_type = (AudioFiles, Indices)
-        self.output_type = Data
+        self.output_type = FeatureStore
         self.windowsize = windowsize
         self.hopsize = hopsize
         self.kweighting = kweighting
         self.truepeak = truepeak
 
     def load_cache(self):
-        self.output = Data(read_json(self.dump_path))
+        self.output = FeatureStore.load(self.dump_path)
 
     def dump(self):
-        write_json(self.dump_path, self.output.data)
+        self.output.save(self.dump_path)
+
+    def collect(self, results):
+        return FeatureStore(results)
+
+    def load(self, workable):
+        if not self.microcache_path(workable).exists():
+            warm(workable)
 
     def analyse(self, workable):
-        hsh = create_hash(workable, self.identity)
-        cache = self.process.cache / f"{hsh}.npy"
+        cache = self.microcache(workable)
 
         if cache.exists():
             loudness = np.load(cache, allow_pickle=True)
@@ -47,35 +55,40 @@ class Loudness(FTISAnalyser):
                 ), "numpy",
             )
             np.save(cache, loudness)
-        workable["feature"] = loudness.tolist()
-        self.buffer[workable["id"]] = workable
+        self.buffer[workable["id"]] = loudness.astype(np.float32)
 
     def adapt_input(self):
-        if isinstance(self.input, AudioFiles):
+        self.workables = []
+        if not isinstance(self.input, Indices):
             for x in self.input:
                 self.workables.append({
-                    "file" : x,
-                    "id" : x,
+                    "file" : str(x),
+                    "id" : str(x),
                     "startframe" : 0,
                     "numframes" : -1
                 })
-        if isinstance(self.input, Indices):
+        else:
             for k, v in self.input:
                 for i, (start, end) in enumerate(zip(v, v[1:])):
                     self.workables.append({
                         "file" : k,
                         "id" : f'{k}_{i}',
                         "startframe" : start,
-                        "numframes" : end
+                        "numframes" : end - start
                     })
+        self.workables = self.split_workables(self.workables, self.hopsize, self.windowsize)
 
     def run(self):
-        self.buffer = Manager().dict()
-        multiproc(self.name, self.analyse, self.workables)
-        self.output = Data(dict(self.buffer))
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.workables, key=self.workable_key)
+        if workables:
+            multiproc(self.name, self.analyse, workables)
+        self.output = self.collect(gather(dict(self.buffer), self.workables))
 
 
 class Pitch(FTISAnalyser):
+    dump_type = ".npz"
+
     def __init__(self, 
         algorithm=2,
         minfreq=20,
@@ -88,7 +101,7 @@ class Pitch(FTISAnalyser):
     ):
         super().__init__(cache=cache, pre=pre, post=post)
         self.input_type = (AudioFiles, Indices)
-        self.output_type = Data
+        self.output_type = FeatureStore
         self.algorithm=algorithm
         self.minfreq=minfreq
         self.maxfreq=maxfreq
@@ -96,14 +109,26 @@ class Pitch(FTISAnalyser):
         self.fftsettings=fftsettings
 
     def load_cache(self):
-        self.output = Data(read_json(self.dump_path))
+        self.output = FeatureStore.load(self.dump_path)
 
     def dump(self):
-        write_json(self.dump_path, self.output.data)
+        self.output.save(self.dump_path)
+
+    def collect(self, results):
+        return FeatureStore(results)
+
+    def load(self, workable):
+        if not self.microcache_path(workable).exists():
+            warm(workable)
+
+    def frame_settings(self) -> tuple:
+        """The hop and the longest span of audio behind one frame, for chunking"""
+        window, hop, fft = self.fftsettings
+        hop = hop if hop > 0 else window // 2
+        return hop, max(window, fft)
 
     def analyse(self, workable):
-        hsh = create_hash(workable, self.identity)
-        cache = self.process.cache / f"{hsh}.npy"
+        cache = self.microcache(workable)
 
         if cache.exists():
             pitch = np.load(cache, allow_pickle=True)
@@ -121,35 +146,42 @@ class Pitch(FTISAnalyser):
                 ), "numpy",
             )
             np.save(cache, pitch)
-        workable["features"] = pitch.tolist()
-        self.buffer[workable["id"]] = workable
+        self.buffer[workable["id"]] = pitch.astype(np.float32)
 
     def adapt_input(self):
-        if isinstance(self.input, AudioFiles):
+        self.workables = []
+        if not isinstance(self.input, Indices):
             for x in self.input:
                 self.workables.append({
-                    "file" : x,
-                    "id" : x,
+                    "file" : str(x),
+                    "id" : str(x),
                     "startframe" : 0,
                     "numframes" : -1
                 })
-        if isinstance(self.input, Indices):
+        else:
             for k, v in self.input:
                 for i, (start, end) in enumerate(zip(v, v[1:])):
                     self.workables.append({
                         "file" : k,
                         "id" : f'{k}_{i}',
                         "startframe" : start,
-                        "numframes" : end
+                        "numframes" : end - start
                     })
+        self.workables = self.split_workables(self.workables, *self.frame_settings())
 
     def run(self):
-        self.buffer = Manager().dict()
-        multiproc(self.name, self.analyse, self.workables)
-        self.output = Data(dict(self.buffer))
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.workables, key=self.workable_key)
+        if workables:
+            multiproc(self.name, self.analyse, workables)
+        self.output = self.collect(gather(dict(self.buffer), self.workables))
 
 
 class MFCC(FTISAnalyser):
+    itemwise = True
+    stream_method = "analyse"
+    dump_type = ".npz"
+
     def __init__(self,
         fftsettings=[1024, 512, 1024],
         numbands=40,
@@ -160,7 +192,7 @@ class MFCC(FTISAnalyser):
     ):
         super().__init__(cache=cache)
         self.input_type = (AudioFiles, Indices)
-        self.output_type = Data
+        self.output_type = FeatureStore
         self.fftsettings = fftsettings
         self.numbands = numbands
         self.numcoeffs = numcoeffs
@@ -168,14 +200,20 @@ class MFCC(FTISAnalyser):
         self.maxfreq = maxfreq
 
     def load_cache(self):
-        self.output = read_json(self.dump_path)
+        self.output = FeatureStore.load(self.dump_path)
 
     def dump(self):
-        write_json(self.dump_path, self.output)
+        self.output.save(self.dump_path)
+
+    def collect(self, results):
+        return FeatureStore(results)
+
+    def load(self, workable):
+        if not self.microcache_path(workable).exists():
+            warm(workable)
 
     def analyse(self, workable):
-        hsh = create_hash(workable, self.identity)
-        cache = self.process.cache / f"{hsh}.npy"
+        cache = self.microcache(workable)
         if cache.exists():
             mfcc = np.load(cache, allow_pickle=True)
         else:
@@ -190,18 +228,23 @@ class MFCC(FTISAnalyser):
                 ), "numpy",
             )
             np.save(cache, mfcc)
-        self.buffer[str(workable)] = mfcc.tolist()
+        self.buffer[str(workable)] = mfcc.astype(np.float32)
 
     def run(self):
-        self.buffer = Manager().dict()
-        singleproc(self.name, self.analyse, self.input)
-        self.output = dict(self.buffer)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            singleproc(self.name, self.analyse, workables)
+        self.output = self.collect(dict(self.buffer))
 
 
 
 # Slicing
 
 class Onsetslice(FTISAnalyser):
+    itemwise = True
+    stream_method = "analyse"
+
     def __init__(
         self,
         fftsettings=[1024, 512, 1024],
@@ -226,9 +269,12 @@ class Onsetslice(FTISAnalyser):
     def dump(self):
         write_json(self.dump_path, self.output)
 
+    def load(self, workable):
+        if not self.microcache_path(workable, ".wav").exists():
+            warm(workable)
+
     def analyse(self, workable):
-        hsh = create_hash(workable, self.identity)
-        cache = self.process.cache / f"{hsh}.wav"
+        cache = self.microcache(workable, ".wav")
         if not cache.exists():
             slice_output = get_buffer(
                 fluid.onsetslice(
@@ -248,12 +294,17 @@ class Onsetslice(FTISAnalyser):
         self.buffer[str(workable)] = slice_output.tolist()
 
     def run(self):
-        self.buffer = Manager().dict()
-        singleproc(self.name, self.analyse, self.input)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            singleproc(self.name, self.analyse, workables)
         self.output = dict(self.buffer)
 
 
 class Noveltyslice(FTISAnalyser):
+    itemwise = True
+    stream_method = "analyse"
+
     def __init__(
         self,
         feature=0,
@@ -278,6 +329,9 @@ class Noveltyslice(FTISAnalyser):
     def dump(self):
         write_json(self.dump_path, self.output)
 
+    def load(self, workable):
+        warm(workable)
+
     def analyse(self, workable):
         noveltyslice = fluid.noveltyslice(
             workable,   
@@ -290,8 +344,10 @@ class Noveltyslice(FTISAnalyser):
         self.buffer[workable] = [int(x) for x in get_buffer(noveltyslice)]
 
     def run(self):
-        self.buffer = Manager().dict()
-        multiproc(self.name, self.analyse, self.input)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            multiproc(self.name, self.analyse, workables)
         self.output = dict(self.buffer)
 
 
@@ -1,20 +1,17 @@
 from ftis.common.analyser import FTISAnalyser
-from ftis.common.io import write_json, read_json
-from ftis.common.proc import singleproc, multiproc
-from multiprocessing import Manager
-from scipy.signal import savgol_filter
-from scipy.io import wavfile
-from sklearn.cluster import AgglomerativeClustering
-from sklearn.preprocessing import StandardScaler
+from ftis.common.prefetch import warm
+from ftis.common.io import write_json, read_json, get_sr
+from ftis.common.proc import multiproc
 from flucoma import fluid
 from flucoma.utils import get_buffer
 import numpy as np
 from ftis.common.types import Indices
-import hdbscan
 from pathlib import Path
 
 
 class ClusteredNMF(FTISAnalyser):
+    shareable = False
+
     def __init__(
         self,
         iterations=100,
@@ -39,12 +36,19 @@ class ClusteredNMF(FTISAnalyser):
         self.dump_type = ".json"
 
     def load_cache(self):
-        self.output = read_json(self.dump_path)
+        self.output = Path(read_json(self.dump_path))
 
     def dump(self):
-        write_json(self.dump_path, self.output)
+        write_json(self.dump_path, str(self.output))
+
+    def load(self, workable):
+        warm(workable)
 
     def analyse(self, workable):
+        from scipy.signal import savgol_filter
+        from scipy.io import wavfile
+        import hdbscan
+
         nmf = fluid.nmf(
             workable,
             iterations=self.iterations,
@@ -52,10 +56,7 @@ class ClusteredNMF(FTISAnalyser):
             fftsettings=self.fftsettings,
         )
         bases = get_buffer(nmf.bases, "numpy")
-        bases_smoothed = np.zeros_like(bases)
-
-        for i, x in enumerate(bases):
-            bases_smoothed[i] = savgol_filter(x, self.smoothing, self.polynomial)
+        bases_smoothed = savgol_filter(bases, self.smoothing, self.polynomial, axis=-1)
 
         clusterer = hdbscan.HDBSCAN(
             min_cluster_size=self.min_cluster_size,
@@ -64,26 +65,35 @@ class ClusteredNMF(FTISAnalyser):
         )
 
         cluster_labels = clusterer.fit_predict(bases_smoothed)
-        unique_clusters = list(dict.fromkeys(cluster_labels))
+        unique_clusters = np.array(list(dict.fromkeys(cluster_labels)))
 
-        sound = get_buffer(nmf.resynth, "numpy")
+        sound = get_buffer(nmf.resynth, "numpy")  # components x samples
+        # Sum the components of every cluster at once with a clusters x components mask
+        mask = (unique_clusters[:, None] == cluster_labels[None, :]).astype(sound.dtype)
+        summed = mask @ sound
 
-        for x in unique_clusters:
-            summed = np.zeros_like(sound[0])  # make an empty numpy array of same size
-            base = Path(workable).name
+        sr = get_sr(workable)
+        base = Path(workable).name
+        written = []
+        for x, audio in zip(unique_clusters, summed):
             output = self.output / f"{base}_{x}.wav"
-            for idx, cluster in enumerate(cluster_labels):
-                if cluster == x:
-                    summed += sound[idx]
-            wavfile.write(output, 44100, summed)
+            wavfile.write(output, sr, audio)
+            written.append(str(output))
+        self.buffer[workable] = written
 
     def run(self):
         self.output = self.process.sink / f"{self.order}_{self.__class__.__name__}"
         self.output.mkdir(exist_ok=True)
-        singleproc(self.name, self.analyse, self.input)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            multiproc(self.name, self.analyse, workables)
 
 
 class ClusteredSegmentation(FTISAnalyser):
+    itemwise = True
+    stream_method = "analyse"
+
     def __init__(self, numclusters=2, windowsize=4, numderivs=0, fftsettings=[1024, -1, -1], cache=False):
         super().__init__(cache=cache)
         self.input_type = (Indices, )
@@ -100,6 +110,9 @@ class ClusteredSegmentation(FTISAnalyser):
         write_json(self.dump_path, self.output)
 
     def analyse(self, workable):
+        from sklearn.cluster import AgglomerativeClustering
+        from sklearn.preprocessing import StandardScaler
+
         slices = self.input[workable]
         if len(slices) == 1:
             self.buffer[workable] = slices
@@ -140,6 +153,8 @@ class ClusteredSegmentation(FTISAnalyser):
         self.buffer[workable] = slices
 
     def run(self):
-        self.buffer = Manager().dict()
-        multiproc(self.name, self.analyse, self.input)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            multiproc(self.name, self.analyse, workables)
         self.output = dict(self.buffer)
\ No newline at end of file
@@ -1,54 +1,122 @@
 from ftis.common.analyser import FTISAnalyser
 from ftis.common.io import write_json, read_json
 from ftis.common.proc import staticproc
-from sklearn.preprocessing import MinMaxScaler, StandardScaler
-from joblib import dump as jdump
+from ftis.common.utils import create_hash, fingerprint
 import numpy as np
 
 
-class Normalise(FTISAnalyser):
-    def __init__(self, minimum=0, maximum=1, cache=False):
+class Scaler(FTISAnalyser):
+    """
+    Shared machinery for scalers that can reuse a persisted model.
+    Items the model has already seen keep their previous output, new or changed items are transformed
+    and the model is refit once the share of items it was not fitted on exceeds `drift`.
+    """
+
+    def __init__(self, incremental=False, drift=0.2, cache=False):
         super().__init__(cache=cache)
-        self.min = minimum
-        self.max = maximum
+        self.incremental = incremental
+        self.drift = drift
+        self.model = None
 
     def load_cache(self):
         self.output = read_json(self.dump_path)
 
     def dump(self):
+        if self.model is not None:
+            from joblib import dump as jdump
+
+            jdump(self.model, self.model_dump)
+            write_json(self.model_meta, self.meta)
         write_json(self.dump_path, self.output)
 
-    def analyse(self):
-        scaled_data = MinMaxScaler((self.min, self.max)).fit_transform(self.features)
+    def create_model(self):
+        """Implemented in the scaler"""
 
-        self.output = {}
-        for k, v in zip(self.keys, scaled_data):
-            self.output[k] = v.tolist()
+    def model_params(self) -> str:
+        return create_hash(self.create_model().get_params())
 
-    def run(self):
-        self.keys = [x for x in self.input.keys()]
-        self.features = [x for x in self.input.values()]
-        staticproc(self.name, self.analyse)
+    def load_model(self) -> bool:
+        if not self.model_dump.exists() or not self.model_meta.exists() or not self.dump_path.exists():
+            return False
+        self.meta = read_json(self.model_meta)
+        if self.meta.get("params") != self.model_params():
+            return False
+        from joblib import load as jload
 
+        self.model = jload(self.model_dump)
+        return True
 
-class Standardise(FTISAnalyser):
-    def __init__(self, cache=False):
-        super().__init__(cache=cache)
+    def transform(self, keys) -> dict:
+        if not keys:
+            return {}
+        scaled_data = self.model.transform([self.input[k] for k in keys])
+        return {k: v.tolist() for k, v in zip(keys, scaled_data)}
 
-    def load_cache(self):
-        self.output = read_json(self.dump_path)
+    def fit(self) -> dict:
+        self.model = self.create_model()
+        scaled_data = self.model.fit_transform(self.features)
+        self.meta["fitted"] = self.meta["seen"]
+        return {k: v.tolist() for k, v in zip(self.keys, scaled_data)}
 
-    def dump(self):
-        jdump(self.model, self.model_dump)
-        write_json(self.dump_path, self.output)
+    def update(self) -> bool:
+        """Transform only unseen items with the persisted model if it is still representative"""
+        if not self.load_model():
+            return False
+        fitted, seen = self.meta["fitted"], self.meta["seen"]
+        fingerprints = fingerprint(self.input)
+        unseen = [k for k in self.keys if fitted.get(k) != fingerprints[k]]
+        if len(unseen) > self.drift * len(self.keys):
+            return False
+
+        previous = read_json(self.dump_path)
+        stale = [k for k in self.keys if seen.get(k) != fingerprints[k] or k not in previous]
+        self.output = {k: previous[k] for k in self.keys if k in previous}
+        self.output.update(self.transform(stale))
+        self.output = {k: self.output[k] for k in self.keys}
+        self.meta["seen"] = fingerprints
+        return True
 
     def analyse(self):
-        self.model = StandardScaler()
-        self.model.fit(self.features)
-        scaled_data = self.model.transform(self.features)
-        self.output = {k: list(v) for k, v in zip(self.keys, scaled_data)}
+        if self.incremental and self.update():
+            return
+        self.meta = {"params": self.model_params(), "seen": fingerprint(self.input)}
+        self.output = self.fit()
 
     def run(self):
         self.keys = [k for k in self.input.keys()]
         self.features = [v for v in self.input.values()]
         staticproc(self.name, self.analyse)
+
+
+class Normalise(Scaler):
+    def __init__(self, minimum=0, maximum=1, incremental=False, drift=0.2, cache=False):
+        super().__init__(incremental=incremental, drift=drift, cache=cache)
+        self.min = minimum
+        self.max = maximum
+
+    def create_model(self):
+        from sklearn.preprocessing import MinMaxScaler
+
+        return MinMaxScaler((self.min, self.max))
+
+    def transform(self, keys) -> dict:
+        transformed = super().transform(keys)
+        # New extremes would fall outside of the range so the persisted model is no longer valid
+        if any(np.min(v) < self.min or np.max(v) > self.max for v in transformed.values()):
+            self.meta["fitted"] = {}
+        return transformed
+
+    def update(self) -> bool:
+        if not super().update():
+            return False
+        return bool(self.meta["fitted"])
+
+
+class Standardise(Scaler):
+    def __init__(self, incremental=False, drift=0.2, cache=False):
+        super().__init__(incremental=incremental, drift=drift, cache=cache)
+
+    def create_model(self):
+        from sklearn.preprocessing import StandardScaler
+
+        return StandardScaler()
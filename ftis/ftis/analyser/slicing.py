@@ -1,13 +1,15 @@
 from ftis.common.analyser import FTISAnalyser
+from ftis.common.prefetch import warm
 from ftis.common.io import write_json, read_json
 from ftis.common.proc import multiproc, singleproc
-from ftis.common.utils import create_hash
-from multiprocessing import Manager
 from flucoma.utils import get_buffer
 from flucoma import fluid
 
 
 class FluidOnsetslice(FTISAnalyser):
+    itemwise = True
+    stream_method = "analyse"
+
     def __init__(
         self,
         fftsettings=[1024, 512, 1024],
@@ -33,9 +35,12 @@ class FluidOnsetslice(FTISAnalyser):
     def dump(self):
         write_json(self.dump_path, self.output)
 
+    def load(self, workable):
+        if not self.microcache_path(workable, ".wav").exists():
+            warm(workable)
+
     def analyse(self, workable):
-        hsh = create_hash(workable, self.identity)
-        cache = self.process.cache / f"{hsh}.wav"
+        cache = self.microcache(workable, ".wav")
         if not cache.exists():
             slice_output = get_buffer(
                 fluid.onsetslice(
@@ -56,12 +61,17 @@ class FluidOnsetslice(FTISAnalyser):
         self.buffer[str(workable)] = slice_output.tolist()
 
     def run(self):
-        self.buffer = Manager().dict()
-        singleproc(self.name, self.analyse, self.input)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            singleproc(self.name, self.analyse, workables)
         self.output = dict(self.buffer)
 
 
 class FluidNoveltyslice(FTISAnalyser):
+    itemwise = True
+    stream_method = "analyse"
+
     def __init__(
         self,
         feature=0,
@@ -87,6 +97,9 @@ class FluidNoveltyslice(FTISAnalyser):
     def dump(self):
         write_json(self.dump_path, self.output)
 
+    def load(self, workable):
+        warm(workable)
+
     def analyse(self, workable):
         noveltyslice = fluid.noveltyslice(
             workable,
@@ -100,6 +113,8 @@ class FluidNoveltyslice(FTISAnalyser):
         self.buffer[str(workable)] = get_buffer(noveltyslice)
 
     def run(self):
-        self.buffer = Manager().dict()
-        multiproc(self.name, self.analyse, self.input)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            multiproc(self.name, self.analyse, workables)
         self.output = dict(self.buffer)
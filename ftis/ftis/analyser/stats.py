@@ -1,9 +1,7 @@
 from ftis.common.analyser import FTISAnalyser
 from ftis.common.io import write_json, read_json
 from ftis.common.proc import singleproc
-from multiprocessing import Manager
-from scipy.stats import describe
-from ftis.common.types import Data
+from ftis.common.types import Data, FeatureStore
 from math import sqrt
 import numpy as np
 
@@ -11,6 +9,9 @@ import numpy as np
 class Stats(FTISAnalyser):
     """Get various statistics and derivatives of those"""
 
+    itemwise = True
+    stream_method = "analyse"
+
     def __init__(
         self,
         numderivs=0,
@@ -20,7 +21,7 @@ class Stats(FTISAnalyser):
     ):
 
         super().__init__(cache=cache)
-        self.input_type = (Data, )
+        self.input_type = (Data, FeatureStore)
         self.output_type = Data
         self.numderivs = numderivs
         self.flatten = flatten
@@ -34,6 +35,8 @@ class Stats(FTISAnalyser):
 
     @staticmethod
     def calc_stats(data, spec):
+        from scipy.stats import describe
+
         description = describe(data)
         output = []
         if "mean" in spec:
@@ -81,6 +84,8 @@ class Stats(FTISAnalyser):
         self.buffer[workable] = element_container
 
     def run(self):
-        self.buffer = Manager().dict()
-        singleproc(self.name, self.analyse, self.input)
+        self.buffer = self.checkpoint()
+        workables = self.buffer.remaining(self.input)
+        if workables:
+            singleproc(self.name, self.analyse, workables)
         self.output = dict(self.buffer)
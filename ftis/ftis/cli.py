@@ -0,0 +1,218 @@
+"""
+Run a World graph described by a YAML or TOML spec.
+
+sink: ~/corpus-folder/out
+corpora:
+  - path: ~/corpus-folder/corpus1
+    filters:
+      - duration: {min_duration: 0.5, max_duration: 10}
+    chain:
+      - CollapseAudio
+      - MFCC: {fftsettings: [2048, 512, 2048]}
+      - analyser: Stats
+        params: {numderivs: 1}
+        children:
+          - [Standardise, UMAP]
+          - [Normalise, HDBSCAN]
+
+A chain is a list of nodes connected one after another. A node is either the name of an analyser,
+a mapping of one analyser name to its parameters or a mapping with "analyser", "params" and
+"children", where children is a list of chains that branch from that node.
+"""
+
+import sys
+import json
+import argparse
+from importlib import import_module
+from pathlib import Path
+from ftis.common.exceptions import AnalyserNotFound, InvalidYamlError
+from ftis.common.utils import create_hash
+
+# Analysers are only imported when a spec uses them so that startup stays quick
+analysers = {
+    "CollapseAudio": "ftis.analyser.audio.CollapseAudio",
+    "ExplodeAudio": "ftis.analyser.audio.ExplodeAudio",
+    "AgglomerativeClustering": "ftis.analyser.clustering.AgglomerativeClustering",
+    "MiniBatchKMeans": "ftis.analyser.clustering.MiniBatchKMeans",
+    "HDBSCAN": "ftis.analyser.clustering.HDBSCAN",
+    "KDTree": "ftis.analyser.clustering.KDTree",
+    "Flux": "ftis.analyser.descriptor.Flux",
+    "Chroma": "ftis.analyser.descriptor.Chroma",
+    "LibroMFCC": "ftis.analyser.descriptor.LibroMFCC",
+    "LibroCQT": "ftis.analyser.descriptor.LibroCQT",
+    "UMAP": "ftis.analyser.dr.UMAP",
+    "Loudness": "ftis.analyser.flucoma.Loudness",
+    "Pitch": "ftis.analyser.flucoma.Pitch",
+    "MFCC": "ftis.analyser.flucoma.MFCC",
+    "ClusteredNMF": "ftis.analyser.meta.ClusteredNMF",
+    "ClusteredSegmentation": "ftis.analyser.meta.ClusteredSegmentation",
+    "Normalise": "ftis.analyser.scaling.Normalise",
+    "Standardise": "ftis.analyser.scaling.Standardise",
+    "FluidOnsetslice": "ftis.analyser.slicing.FluidOnsetslice",
+    "FluidNoveltyslice": "ftis.analyser.slicing.FluidNoveltyslice",
+    "Stats": "ftis.analyser.stats.Stats",
+    "DurationFilter": "ftis.filters.Duration",
+    "LoudnessFilter": "ftis.filters.Loudness",
+    "Visualiser": "ftis.visualisation.Visualiser",
+}
+
+
+def load_spec(path: str) -> dict:
+    path = Path(path).expanduser()
+    if path.suffix == ".toml":
+        try:
+            import tomllib as toml
+        except ImportError:  # python < 3.11
+            import toml
+        with open(path, "rb" if toml.__name__ == "tomllib" else "r") as f:
+            return toml.load(f)
+    import yaml
+
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
+
+def spec_hash(spec: dict) -> str:
+    return create_hash(json.dumps(spec, sort_keys=True))
+
+
+def resolve(name: str):
+    """Find an analyser class by its short name or a full dotted path"""
+    dotted = analysers.get(name, name)
+    module, _, cls = dotted.rpartition(".")
+    try:
+        return getattr(import_module(module), cls)
+    except (ImportError, AttributeError, ValueError):
+        raise AnalyserNotFound(f"{name} is not a known analyser")
+
+
+def parse_node(node) -> tuple:
+    """Return the analyser name, its parameters and any child chains of a node"""
+    if isinstance(node, str):
+        return node, {}, []
+    if isinstance(node, dict) and "analyser" in node:
+        return node["analyser"], node.get("params") or {}, node.get("children") or []
+    if isinstance(node, dict) and len(node) == 1:
+        name, params = next(iter(node.items()))
+        return name, params or {}, []
+    raise InvalidYamlError(f"Could not understand the node {node}")
+
+
+def connect(parent, chain: list, resume: bool = False) -> None:
+    for node in chain:
+        name, params, children = parse_node(node)
+        if resume:
+            params = {**params, "cache": True}
+        parent = parent >> resolve(name)(**params)
+        for child in children:
+            connect(parent, child, resume)
+
+
+def build_world(
+    spec: dict,
+    sink=None,
+    workers=None,
+    cache=None,
+    resume=False,
+    quiet=False,
+    profile=None,
+    queue=None,
+    stream=False,
+    store=None,
+):
+    from ftis.world import World
+    from ftis.corpus import Corpus
+
+    world = World(
+        sink=sink or spec["sink"],
+        quiet=quiet,
+        profile=profile or spec.get("profile"),
+        workers=workers or spec.get("workers"),
+        cache=cache or spec.get("cache"),
+        queue=queue or spec.get("queue"),
+        stream=stream or spec.get("stream", False),
+        window=spec.get("window"),
+        chunksize=spec.get("chunksize"),
+        split=spec.get("split", 300),
+        prefetch=spec.get("prefetch", 4),
+        store=store or spec.get("store"),
+    )
+    corpora = []
+    for c in spec["corpora"]:
+        corpus = Corpus(c["path"], **({"file_type": c["file_type"]} if "file_type" in c else {}))
+        for f in c.get("filters", []):
+            name, params = next(iter(f.items())) if isinstance(f, dict) else (f, {})
+            getattr(corpus, name)(**(params or {}))
+        connect(corpus, c.get("chain", []), resume)
+        corpora.append(corpus)
+
+    world.build(*corpora)
+    world.metadata["spec"] = spec_hash(spec)
+    return world
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ftis", description="Run ftis graphs from a YAML or TOML spec")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for command, text in (("run", "Run a graph"), ("plan", "Show what a run would do without running it")):
+        sub = commands.add_parser(command, help=text)
+        sub.add_argument("spec", type=str, help="Path to the graph spec")
+        sub.add_argument("-s", "--sink", default=None, type=str, help="Override the sink of the spec")
+        sub.add_argument("-c", "--cache", default=None, type=str, help="Folder for the microcache")
+        sub.add_argument("-w", "--workers", default=None, type=int, help="Threads per analyser")
+        sub.add_argument("-r", "--resume", action="store_true", help="Reuse the output of finished nodes")
+        sub.add_argument("-q", "--quiet", action="store_true")
+        sub.add_argument("--profile", default=None, choices=["cprofile", "sample"])
+        sub.add_argument(
+            "--queue", default=None, type=str, help="Shared work queue for ftis worker processes"
+        )
+        sub.add_argument(
+            "--stream", action="store_true", help="Start per item children before their parent finishes"
+        )
+        sub.add_argument("--store", default=None, type=str, help="Artifact store shared with other sinks")
+
+    sub = commands.add_parser("hash", help="Print the hash of a graph spec")
+    sub.add_argument("spec", type=str)
+
+    sub = commands.add_parser("worker", help="Run tasks from the work queue of a distributed run")
+    sub.add_argument("queue", type=str, help="Path to the shared work queue")
+    sub.add_argument("--idle", default=None, type=float, help="Exit after this many seconds without work")
+    sub.add_argument(
+        "--lease", default=600.0, type=float, help="Seconds before an unfinished task is retried"
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        from ftis.common.distributed import WorkQueue, work
+
+        work(WorkQueue(args.queue, lease=args.lease), idle=args.idle)
+        return 0
+
+    spec = load_spec(args.spec)
+
+    if args.command == "hash":
+        print(spec_hash(spec))
+        return 0
+
+    world = build_world(
+        spec,
+        sink=args.sink,
+        workers=args.workers,
+        cache=args.cache,
+        resume=args.resume,
+        quiet=args.quiet,
+        profile=args.profile,
+        queue=args.queue,
+        stream=args.stream,
+        store=args.store,
+    )
+    if args.command == "plan":
+        world.plan()
+    else:
+        world.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,42 @@
 from ftis.common.exceptions import OutputNotFound, ChainIOError
-from ftis.common.io import read_json, write_json
+from ftis.common.io import read_json, write_json, get_info
 from ftis.common.utils import ignored_keys, create_hash
+from ftis.common.types import FTISType, item_keys, subset, fan_out, fold_in
+from ftis.common.profile import measure, profiled
+from ftis.common.checkpoint import Checkpoint
+from ftis.common.stream import Stream
+from ftis.common.chunking import split, siblings
+from ftis.common.prefetch import Prefetcher
+from ftis.common.store import input_fingerprint
+from contextlib import contextmanager
 from collections.abc import Callable
 from collections import OrderedDict
 from pathlib import Path
+import os
+import copy
+from threading import Lock
+from concurrent.futures import Future
+import time
+import numpy as np
+
+microcache_lock = Lock()
 
 
 class FTISAnalyser:
     """Every analyser inherits from this class"""
+    # Analysers whose output is keyed by their input keys can be run on only the items that changed
+    itemwise: bool = False
+    # The method that processes one input key, for analysers that can consume a parent as it runs
+    stream_method: str = None
+    dump_type: str = ".json"
+    # Workables to read ahead of the workers, None uses World.prefetch and 0 switches it off
+    prefetch: int = None
+    # Whether the output can be reused by other sinks, not for analysers that write files into the sink
+    shareable: bool = True
+    # Parameters of this node when it is one variant of a sweep, and a tag keeping its dumps apart
+    variant: dict = None
+    tag: str = ""
+
     def __init__(self, cache=False, pre=None, post=None):
         self.process = None  # pass the parent process in
         self.input = None  
@@ -28,6 +57,22 @@ class FTISAnalyser:
         self.parent_string = self.__class__.__name__
         self.identity = {}
         self.workables = []
+        self.fresh = None  # output keys that changed since the last run, None when unknown
+        self.profile = None  # "cprofile" or "sample" to profile run()
+        self.microcache_stats = {"hits": 0, "lookups": 0}
+        self.streams = {}  # children consuming this node while it runs
+        self.frames = {}  # frames of audio behind each scheduled workable
+        self.timings = {}  # seconds each workable took, fed back into scheduling on the next run
+        self.pool = None  # prefetched data while the workables are being processed
+
+    def clone(self, **params):
+        """A copy of this node and everything after it, with some parameters changed"""
+        shared = ("process", "parent", "chain", "input", "output", "pre", "post")
+        node = copy.copy(self)
+        node.__dict__ = {k: v if k in shared else copy.deepcopy(v) for k, v in vars(self).items()}
+        node.__dict__.update(params)
+        node.chain = OrderedDict((child.clone(), None) for child in self.chain)
+        return node
 
     def __str__(self):
         return f"{self.__class__.__name__}"
@@ -52,6 +97,8 @@ class FTISAnalyser:
         self.parent_parameters = {}
         self.traverse_parent_parameters()
         self.identity["hash"] = create_hash(self.parent_parameters, p)
+        # The lineage ignores which items the corpus holds so it survives items being added or removed
+        self.identity["lineage"] = create_hash(self.parent.identity["lineage"], p)
 
     def compare_meta(self) -> bool:
         # TODO You could use a hashing function here to determine the similarity of the metadata
@@ -72,13 +119,353 @@ class FTISAnalyser:
             success = False
         return old_params == new_params and success
 
+    def is_cached(self) -> bool:
+        """Whether the whole output can be loaded from the previous run"""
+        return bool(self.cache and self.cache_exists() and self.compare_meta() and self.process.metapath.exists())
+
+    def store(self):
+        store = getattr(self.process, "store", None)
+        return store if self.cache and self.shareable else None
+
+    def artifact_key(self) -> str:
+        return create_hash(self.identity["hash"], input_fingerprint(self.input, self.corpus_index()))
+
+    def artifact_files(self) -> dict:
+        files = {"output": self.dump_path}
+        if getattr(self, "model_dump", None) is not None:
+            files.update(model=self.model_dump, meta=self.model_meta)
+        return files
+
+    def fetch(self) -> bool:
+        """Copy the output of this node from the artifact store, if any world computed it on the same input"""
+        store = self.store()
+        if store is None or self.input is None:
+            return False
+        return store.fetch(self.artifact_key(), self.artifact_files())
+
+    def publish(self) -> None:
+        store = self.store()
+        if store is not None and self.input is not None:
+            store.publish(self.artifact_key(), self.artifact_files())
+
+    def previous_run(self) -> str:
+        """The identity hash this node had on the previous run, if any"""
+        try:
+            return self.process.prev_meta["lineage"][self.identity["lineage"]]
+        except (KeyError, TypeError):
+            return None
+
+    def can_merge_previous(self) -> bool:
+        """Whether a previous output exists that changed items could be merged into"""
+        if not self.cache or not self.itemwise or not self.dump_path.exists():
+            return False
+        try:
+            return self.process.prev_meta["success"][self.previous_run()]
+        except (KeyError, TypeError):
+            return False
+
+    def delta_possible(self) -> bool:
+        """Whether the previous output can be reused for everything except the changed items"""
+        return self.parent.fresh is not None and self.can_merge_previous()
+
+    def run_delta(self) -> None:
+        """Run on the changed items only and merge the previous output back in"""
+        self.load_cache()
+        previous = self.output
+        full_input = self.input
+        stale = {str(k) for k in self.parent.fresh}
+        current = {str(k) for k in item_keys(full_input)}
+
+        self.input = subset(full_input, stale)
+        if len(item_keys(self.input)) > 0:
+            self.process_items()
+            computed = self.output
+        else:
+            computed = subset(previous, set())
+        self.input = full_input
+
+        self.output = subset(previous, current - stale)
+        merged = self.output.data if isinstance(self.output, FTISType) else self.output
+        merged.update(computed.data if isinstance(computed, FTISType) else computed)
+        self.fresh = [str(k) for k in item_keys(computed)]
+        self.process.fprint(f"{self.name} ran on {len(self.fresh)} changed items")
+
+    def process_items(self) -> None:
+        self.adapt_input()
+        if self.pre: # preprocess
+            self.pre(self)
+        self.run()
+        if self.post: # postprocess
+            self.post(self)
+
     def cache_exists(self) -> bool:
         if self.dump_path.exists():
             return True
         else:
             return False
 
+    def source_info(self, workable):
+        """The size and mtime of the file behind a workable, so that a modified file misses the microcache"""
+        path = str(workable["file"] if isinstance(workable, dict) else workable)
+        info = self.corpus_index().get(path)
+        if info is None and os.path.isfile(path):
+            stat = os.stat(path)
+            info = {"size": stat.st_size, "mtime": stat.st_mtime}
+        return info
+
+    def microcache_path(self, workable, ext: str = ".npy") -> Path:
+        key = create_hash(workable, self.identity["lineage"], self.source_info(workable))
+        return self.process.cache / f"{key}{ext}"
+
+    def microcache(self, workable, ext: str = ".npy") -> Path:
+        """The microcache entry for a workable, counting whether it already exists"""
+        cache = self.microcache_path(workable, ext)
+        hit = cache.exists()
+        with microcache_lock:
+            self.microcache_stats["lookups"] += 1
+            self.microcache_stats["hits"] += hit
+        return cache
+
+    def neighbour_graph(self, data, k: int):
+        """
+        The kNN graph of data with at least k neighbours per row. It is built by the first node that
+        asks for it, kept for the rest of the run and saved to the microcache for later runs.
+        A node whose build failed does not fail the others, the next one to ask builds it again.
+        """
+        from ftis.index import NeighbourGraph
+
+        data = np.asarray(data, dtype=np.float32)
+        key = NeighbourGraph.key(data)
+        path = self.process.cache / f"{key}.knn.npz"
+        with self.process.lock:
+            future = self.process.graphs.get(key)
+            failed = future is not None and future.done() and future.exception() is not None
+            if future is None or failed or (future.done() and future.result().k < k):
+                future = self.process.graphs[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            try:
+                graph = future.result()
+            except Exception:
+                graph = None  # the node building it failed, build it here instead
+            if graph is not None and graph.k >= min(k, len(data)):
+                return graph
+            future = Future()  # built here, for fewer neighbours than an earlier node asked for or not at all
+        try:
+            graph = NeighbourGraph.load(path) if path.exists() else None
+            if graph is None or graph.k < min(k, len(data)):
+                graph = NeighbourGraph.build(data, max(k, 30))
+                graph.save(path)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(graph)
+        with self.process.lock:
+            self.process.graphs[key] = future
+        return graph
+
+    def checkpoint(self) -> Checkpoint:
+        """A buffer that journals each result so that an interrupted run resumes where it stopped"""
+        self.buffer = Checkpoint(self.process.checkpoints / f"{self.identity['lineage']}.jsonl")
+        self.buffer.listeners = list(self.streams.values())
+        self.buffer.chunks = siblings(self.workables)
+        if len(self.buffer):
+            self.process.fprint(f"{self.name} recovered {len(self.buffer)} results from a checkpoint")
+        return self.buffer
+
+    @staticmethod
+    def workable_key(workable) -> str:
+        return workable["id"] if isinstance(workable, dict) else str(workable)
+
+    def corpus(self):
+        node = getattr(self, "parent", None)
+        while isinstance(node, FTISAnalyser):
+            node = getattr(node, "parent", None)
+        return node
+
+    def corpus_index(self) -> dict:
+        return getattr(self.corpus(), "index", None) or {}
+
+    def aliases(self) -> dict:
+        """Duplicates the corpus skipped, keyed by the item that is analysed in their place"""
+        parent = getattr(self, "parent", None)
+        if isinstance(parent, FTISAnalyser):
+            aliases = parent.aliases()
+        else:
+            aliases = getattr(parent, "aliases", None) or {}
+        return self.rename_aliases(aliases) if aliases else aliases
+
+    def rename_aliases(self, aliases: dict) -> dict:
+        """Aliases in terms of the keys of this node, for analysers that give items new names such as paths"""
+        return aliases
+
+    def dump_all(self) -> None:
+        """Dump the output with the results of every item repeated for its duplicates"""
+        aliases = self.aliases()
+        if not aliases:
+            return self.dump()
+        output = self.output
+        self.output = fan_out(output, aliases)
+        try:
+            self.dump()
+        finally:
+            self.output = output
+
+    def load_all(self) -> None:
+        """Load the cached output, leaving out the duplicates so that children only see representatives"""
+        self.load_cache()
+        self.output = fold_in(self.output, self.aliases())
+
+    def count_frames(self, workable) -> int:
+        """Frames of audio a workable covers, from slice bounds, the corpus index or the file header"""
+        if isinstance(workable, dict):
+            if workable.get("numframes", -1) > 0:
+                return workable["numframes"]
+            workable = workable["file"]
+        info = self.corpus_index().get(str(workable))
+        try:
+            return (info or get_info(workable)).get("frames", 0)
+        except Exception:  # not an audio file, every workable then costs the same
+            return 0
+
+    def split_workables(self, workables: list, hop: int, window: int) -> list:
+        """Cut workables longer than World.split seconds into overlapping chunks that run in parallel"""
+        seconds = getattr(self.process, "split", None)
+        if not seconds:
+            return workables
+        chunks = []
+        for w in workables:
+            try:
+                info = self.corpus_index().get(w["file"]) or get_info(w["file"])
+                frames = w["numframes"] if w["numframes"] > 0 else info["frames"] - w["startframe"]
+                chunks += split(w, frames, hop, window, int(seconds * info["samplerate"]))
+            except Exception:  # no header to size it by, analyse it whole
+                chunks.append(w)
+        return chunks
+
+    def load(self, workable):
+        """Read what a workable needs ahead of time, returning it or None if there is nothing to hold"""
+        return None
+
+    def read(self, workable):
+        """The prefetched data of a workable, loaded now if the prefetcher has not reached it"""
+        data = self.pool.take(self.workable_key(workable)) if self.pool else None
+        return data if data is not None else self.load(workable)
+
+    @contextmanager
+    def prefetcher(self, workables):
+        ahead = self.prefetch if self.prefetch is not None else getattr(self.process, "prefetch", 0)
+        if not ahead or type(self).load is FTISAnalyser.load:
+            yield
+            return
+        self.pool = Prefetcher(
+            workables, self.load, self.workable_key, ahead, getattr(self.process, "prefetch_budget", 256_000_000)
+        )
+        self.pool.start()
+        try:
+            yield
+        finally:
+            self.pool.stop()
+            self.pool = None
+
+    def timings_path(self) -> Path:
+        return self.process.timings / f"{self.identity['lineage']}.json"
+
+    def previous_timings(self) -> dict:
+        """The rate seen last run, from the metadata, and the seconds each workable took, from its own file"""
+        try:
+            previous = dict(self.process.prev_meta["timings"][self.identity["lineage"]])
+        except (KeyError, TypeError, AttributeError):
+            return {}
+        try:
+            previous["seconds"] = read_json(self.timings_path())
+        except (OSError, ValueError):
+            previous["seconds"] = {}
+        return previous
+
+    def schedule(self, workables) -> tuple:
+        """
+        Order workables longest first so that a long file is not left running alone at the end.
+        Costs are the seconds a workable took last time, or its frames scaled by the rate seen last time.
+        Slices of the same file are kept together in the order they appear in the file, with files
+        ordered by their total cost, so one file is read front to back while it is in the page cache.
+        """
+        previous = self.previous_timings()
+        seconds = previous.get("seconds", {})
+        rate = previous.get("rate") or 1.0
+        costs = []
+        for w in workables:
+            key = self.workable_key(w)
+            self.frames[key] = self.count_frames(w)
+            costs.append(seconds[key] if key in seconds else self.frames[key] * rate)
+        files = {}
+        for i, w in enumerate(workables):
+            if isinstance(w, dict):
+                files.setdefault(w["file"], []).append((w["startframe"], i))
+            else:
+                files[i] = [(0, i)]
+        totals = {f: sum(costs[i] for _, i in group) for f, group in files.items()}
+        order = [i for f in sorted(files, key=totals.get, reverse=True) for _, i in sorted(files[f])]
+        return [workables[i] for i in order], [costs[i] for i in order]
+
+    def timed(self, process):
+        def run(workable):
+            start = time.perf_counter()
+            process(workable)
+            self.timings[self.workable_key(workable)] = time.perf_counter() - start
+        return run
+
+    def record_timings(self) -> None:
+        previous = self.previous_timings()
+        seconds = {**previous.get("seconds", {}), **self.timings}
+        frames = sum(self.frames.get(k, 0) for k in self.timings)
+        rate = sum(self.timings.values()) / frames if frames else previous.get("rate")
+        write_json(self.timings_path(), seconds)
+        with self.process.lock:
+            self.process.metadata["timings"][self.identity["lineage"]] = {
+                "rate": rate,
+                "total": sum(seconds.values()),
+                "workables": len(seconds),
+            }
+
+    def summary(self) -> dict:
+        """A few numbers describing the output, written beside the parameters of each variant of a sweep"""
+        if isinstance(self.output, (dict, list, FTISType)):
+            return {"items": len(item_keys(self.output))}
+        return {}
+
+    def count_workables(self) -> int:
+        if self.workables:
+            return len(self.workables)
+        try:
+            return len(item_keys(self.input))
+        except TypeError:
+            return 0
+
+    def record_profile(self, phases: dict) -> None:
+        """Write the timings of each phase into the run metadata"""
+        lookups = self.microcache_stats["lookups"]
+        profile = {
+            "name": self.name,
+            "cached": self.cache_possible,
+            "workables": self.count_workables(),
+            "microcache_hit_ratio": self.microcache_stats["hits"] / lookups if lookups else None,
+            "phases": phases,
+        }
+        with self.process.lock:
+            self.process.metadata["profile"][self.identity["hash"]] = profile
+        if self.timings:
+            self.record_timings()
+        for phase, m in phases.items():
+            self.log(f"{phase} took {m['wall']:.3f}s wall, {m['cpu']:.3f}s cpu")
+
     def update_success(self, status: bool) -> None:
+        with self.process.lock:  # streaming nodes finish on other threads
+            self._update_success(status)
+
+    def _update_success(self, status: bool) -> None:
         try:
             existing_metadata = read_json(self.process.metapath)
         except FileNotFoundError:
@@ -94,39 +481,172 @@ class FTISAnalyser:
         self.process.metadata["success"] = success  # modify the original
         write_json(self.process.metapath, self.process.metadata)
 
+    def streamable(self, child) -> bool:
+        """Whether a child can consume the output of this node item by item while it runs"""
+        return bool(
+            getattr(self.process, "stream", False)
+            and self.itemwise
+            and child.stream_method
+            and self.post is None
+            and child.pre is None
+            and not self.delta_possible()
+            and not child.is_cached()
+            and not child.can_merge_previous()
+        )
+
+    def start_streams(self) -> dict:
+        """Start the children that can run alongside this node, each in its own thread"""
+        streams = {}
+        hashes = set()
+        for child in self.chain:
+            if self.streamable(child) and child.identity["hash"] not in hashes:  # identical children share one
+                hashes.add(child.identity["hash"])
+                stream = Stream(self.process.stream_size)
+                self.streams[child] = stream
+                streams[child] = self.process.spawn(child.walk_stream, stream)
+        return streams
+
+    def close_streams(self, failed: bool = False) -> None:
+        for stream in self.streams.values():
+            stream.close(failed)
+        self.streams = {}
+
+    def consume(self, stream) -> None:
+        """Process items as the parent produces them instead of waiting for its whole output"""
+        self.input = stream
+        self.buffer = self.checkpoint()
+        process = getattr(self, self.stream_method)
+        for key in stream:
+            if key in self.buffer:
+                self.buffer.publish(key, self.buffer[key])
+            else:
+                process(key)
+        self.input = stream.data
+        self.output = self.collect({k: self.buffer[k] for k in stream.data})
+
+    def hooked(self) -> bool:
+        """Whether this node or one of its ancestors has pre or post hooks, which its identity cannot see"""
+        node = self
+        while isinstance(node, FTISAnalyser):
+            if node.pre is not None or node.post is not None:
+                return True
+            node = node.parent
+        return False
+
+    def twin(self) -> Future:
+        """
+        The future of an identical node elsewhere in the graph that ran first, or None when this is the first.
+        Identical nodes have the same parameters and ancestors, so the second one reuses the output of the first.
+        Nodes below a hook always run themselves as the hook may have changed what they compute.
+        """
+        computed = getattr(self.process, "computed", None)
+        if computed is None or self.hooked():
+            return None
+        with self.process.lock:
+            future = computed.get(self.identity["hash"])
+            if future is None:
+                computed[self.identity["hash"]] = Future()
+        return future
+
+    def share(self, error: BaseException = None) -> None:
+        """Hand the output (or the failure) of this node to any identical nodes waiting on it"""
+        future = getattr(self.process, "computed", {}).get(self.identity["hash"])
+        if future is None or future.done() or self.hooked():
+            return
+        if error is None:
+            future.set_result(self)
+        else:
+            future.set_exception(error)
+
+    def walk_twin(self, twin: Future) -> None:
+        original = twin.result()
+        self.output = original.output
+        self.fresh = original.fresh
+        self.process.fprint(f"{self.name} is identical to {original.dump_path.name} and reused its output")
+        self.finish({}, {}, record=False)
+
+    def walk_stream(self, stream) -> None:
+        self.log("Streaming")
+        twin = self.twin()
+        if twin is not None:
+            stream.abandon()
+            return self.walk_twin(twin)
+        self.update_success(False)
+        phases = {}
+        streams = self.start_streams()
+        try:
+            with measure(phases, "run"), profiled(self.profile, self.dump_path):
+                self.consume(stream)
+        except BaseException as e:
+            stream.abandon()
+            self.close_streams(failed=True)
+            self.share(e)
+            raise
+        self.close_streams()
+        self.finish(phases, streams)
+
     def walk_chain(self) -> None:
         self.log("Initialising")
-        # Determine whether we caching is possible
-        if self.cache and self.cache_exists() and self.compare_meta() and self.process.metapath.exists():
+        twin = self.twin()
+        if twin is not None:
+            return self.walk_twin(twin)
+        # Determine whether caching is possible, unless the parent reports items that changed
+        fetched = False
+        if self.is_cached() and not getattr(self.parent, "fresh", None):
             self.cache_possible = True
+        elif self.fetch():
+            self.cache_possible = fetched = True
         
         self.update_success(False)
+        phases = {}
+        streams = {}
         if self.cache_possible:
-            self.load_cache()
-            self.process.fprint(f"{self.name} was cached")
+            with measure(phases, "load_cache"):
+                self.load_all()
+            # Children cannot trust a fetched output to match what they ran on before
+            self.fresh = None if fetched else []
+            self.process.fprint(f"{self.name} was {'fetched from the store' if fetched else 'cached'}")
         else:
-            if self.pre: # preprocess
-                self.pre(self)
-            self.run()
-            if self.post: # postprocess
-                self.post(self)
+            streams = self.start_streams()
+            try:
+                with measure(phases, "run"), profiled(self.profile, self.dump_path):
+                    if self.delta_possible():
+                        self.run_delta()
+                    else:
+                        self.process_items()
+            except BaseException as e:
+                self.close_streams(failed=True)
+                self.share(e)
+                raise
+            self.close_streams()
+        self.finish(phases, streams)
 
+    def finish(self, phases: dict, streams: dict, record: bool = True) -> None:
         if self.output != None: 
             self.log("Ran Successfully")
             self.update_success(True)
         else:
             self.log("Output was invalid")
+            self.share(OutputNotFound(self.name))
             raise OutputNotFound(self.name)
 
-        self.dump()
+        with measure(phases, "dump"):
+            self.dump_all()
+        if record and not self.cache_possible:
+            self.publish()
+        self.share()
+        if isinstance(getattr(self, "buffer", None), Checkpoint):
+            self.buffer.close(completed=True)
+        if record:  # the profile of a reused node belongs to the node that computed it
+            self.record_profile(phases)
         # Pass output to the input of all of connected things
         # TODO: redo type checking
-        for forward_connection in self.chain:
         #     if self.output_type in forward_connection.input_type:
-            forward_connection.input = self.output
-            forward_connection.walk_chain()
+        self.process.walk([c for c in self.chain if c not in streams], self.output)
         #     else:
         #         raise ChainIOError(self, forward_connection)
+        for forward_connection in streams:
+            streams[forward_connection].result()  # already running, wait for it to finish
 
     def _get_parents(self) -> None:
         self.parent_string = (
@@ -138,14 +658,19 @@ class FTISAnalyser:
         if self.scripting:
             self.dump_path  = (
                 self.process.sink / 
-                f"{self.order}.{self.suborder}-{self.parent_string}.json"
+                f"{self.order}.{self.suborder}-{self.parent_string}{self.tag}{self.dump_type}"
             )
             self.model_dump = (
                 self.process.sink / 
-                f"{self.order}.{self.suborder}-{self.parent_string}.joblib"
+                f"{self.order}.{self.suborder}-{self.parent_string}{self.tag}.joblib"
             )
 
 
+    @property
+    def model_meta(self) -> Path:
+        """Sidecar for anything needed to update a persisted model incrementally"""
+        return self.model_dump.with_suffix(".meta.json")
+
     def log(self, log_text: str) -> None:
         try:
             self.process.logger.debug(f"{self.name}: {log_text}")
@@ -166,5 +691,9 @@ class FTISAnalyser:
     def adapt_input(self):
         """Adapters are made on a per object basis"""
 
+    def collect(self, results: dict):
+        """Wrap the per item results of a run in the output type of the analyser"""
+        return results
+
     def run(self) -> None:
         """Method for running the processing chain from input to output"""
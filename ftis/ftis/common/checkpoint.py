@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+from pathlib import Path
+from threading import Lock
+from ftis.common.exceptions import EmptyWorkables
+from ftis.common.chunking import stitch
+from ftis.common.utils import create_hash
+
+
+def _encode(obj):
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return str(obj)
+
+
+class Checkpoint:
+    """
+    A buffer for per workable results that journals every write to disk.
+    If a run is interrupted the journal is replayed on the next run and only the
+    workables without a result are processed again.
+    Arrays are saved as .npy files beside the journal, which only records where they are,
+    so frame level results are not turned into text.
+    """
+
+    def __init__(self, path: Path, sync_interval: float = 1.0):
+        self.path = Path(path)
+        self.arrays = self.path.with_suffix(".arrays")
+        self.sync_interval = sync_interval  # seconds between fsyncs of the journal
+        self.data = {}
+        self.listeners = []  # streams of children that consume results as they arrive
+        self.chunks = {}  # the chunks of each split workable by chunk id, streamed once they are all in
+        self.stitched = set()
+        self.lock = Lock()
+        self.last_sync = time.monotonic()
+        if self.path.exists():
+            self.replay()
+        self.journal = open(self.path, "a")
+
+    def replay(self) -> None:
+        good = 0
+        with open(self.path, "r+") as f:
+            for line in iter(f.readline, ""):
+                try:
+                    key, value, *array = json.loads(line)
+                    if array:
+                        value = np.load(self.arrays / array[0])
+                except (ValueError, OSError):
+                    break  # the process died part way through writing this line
+                self.data[key] = value
+                good = f.tell()
+            f.truncate(good)  # so that new results are not appended to a partial line
+
+    def __setitem__(self, key, value):
+        key = str(key)  # keys come back from the journal as strings
+        if isinstance(value, np.ndarray):
+            line = json.dumps([key, None, self.save_array(key, value)])
+        else:
+            line = json.dumps([key, value], default=_encode)
+        with self.lock:
+            self.data[key] = value
+            self.journal.write(line + "\n")
+            self.journal.flush()
+            if time.monotonic() - self.last_sync > self.sync_interval:
+                os.fsync(self.journal.fileno())
+                self.last_sync = time.monotonic()
+        self.publish(key, value)
+
+    def save_array(self, key: str, value: np.ndarray) -> str:
+        """Write an array in one step, before the journal line that refers to it"""
+        self.arrays.mkdir(exist_ok=True)
+        name = f"{create_hash(key)}.npy"
+        tmp = self.arrays / f".{name}.{os.getpid()}"
+        with open(tmp, "wb") as f:
+            np.save(f, value)
+        os.replace(tmp, self.arrays / name)
+        return name
+
+    def publish(self, key, value) -> None:
+        """Hand a result to streaming children, the chunks of a split workable stitched once the last arrives"""
+        if not self.listeners:
+            return
+        chunks = self.chunks.get(key)
+        if chunks is not None:
+            parent = chunks[0]["parent"]
+            with self.lock:
+                if parent in self.stitched or any(c["id"] not in self.data for c in chunks):
+                    return
+                self.stitched.add(parent)
+                outputs = [self.data[c["id"]] for c in chunks]
+            key, value = parent, stitch(outputs, chunks)
+        for stream in self.listeners:
+            stream.put(key, value)
+
+    def __getitem__(self, key):
+        return self.data[str(key)]
+
+    def __contains__(self, key):
+        return str(key) in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        yield from self.data
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        return self.data.values()
+
+    def items(self):
+        return self.data.items()
+
+    def remaining(self, workables, key=str) -> list:
+        """
+        The workables that do not have a result yet.
+        Recovered results for anything that is no longer a workable are dropped.
+        """
+        if len(workables) == 0:
+            raise EmptyWorkables
+        keys = {str(key(w)) for w in workables}
+        self.data = {k: v for k, v in self.data.items() if k in keys}
+        for k, v in self.data.items():
+            self.publish(k, v)
+        return [w for w in workables if str(key(w)) not in self.data]
+
+    def close(self, completed: bool = False) -> None:
+        """Close the journal, removing it once the results it protects have been dumped"""
+        if not self.journal.closed:
+            self.journal.close()
+        if completed and self.path.exists():
+            self.path.unlink()
+        if completed:
+            shutil.rmtree(self.arrays, ignore_errors=True)
@@ -0,0 +1,78 @@
+"""
+Split long workables into chunks that can be analysed in parallel and stitch their frames back together.
+
+Each chunk starts on a hop boundary and is read with at least one analysis window of extra audio
+either side, so the frames that are kept never see the edges of the chunk. Frame outputs of the
+chunks are trimmed to the frames they own and concatenated along the last axis.
+"""
+
+import numpy as np
+
+
+def plan_chunks(frames: int, hop: int, window: int, chunksize: int) -> list:
+    chunksize = max(hop, chunksize // hop * hop)
+    margin = -(-window // hop) * hop  # a window rounded up to whole hops
+    chunks = []
+    for start in range(0, frames, chunksize):
+        end = min(start + chunksize, frames)
+        last = end == frames
+        pre = min(start, margin)
+        post = 0 if last else min(frames - end, margin)
+        chunks.append(
+            {
+                "startframe": start - pre,
+                "numframes": end - start + pre + post,
+                "skip": pre // hop,
+                "keep": None if last else (end - start) // hop,
+            }
+        )
+    return chunks
+
+
+def split(workable: dict, frames: int, hop: int, window: int, chunksize: int) -> list:
+    """Cut a workable covering frames of audio into chunk workables when it is longer than chunksize"""
+    if not chunksize or frames <= chunksize:
+        return [workable]
+    return [
+        {
+            **workable,
+            "id": f"{workable['id']}@{c['startframe']}",
+            "parent": workable["id"],
+            "startframe": workable["startframe"] + c["startframe"],
+            "numframes": c["numframes"],
+            "skip": c["skip"],
+            "keep": c["keep"],
+        }
+        for c in plan_chunks(frames, hop, window, chunksize)
+    ]
+
+
+def stitch(outputs: list, chunks: list) -> np.ndarray:
+    parts = []
+    for output, chunk in zip(outputs, chunks):
+        stop = None if chunk["keep"] is None else chunk["skip"] + chunk["keep"]
+        parts.append(np.asarray(output)[..., chunk["skip"] : stop])
+    return np.concatenate(parts, axis=-1)
+
+
+def gather(results: dict, workables: list) -> dict:
+    """Results keyed by workable id with the chunks of each split workable stitched back together"""
+    gathered, pieces = {}, {}
+    for w in workables:
+        if "parent" in w:
+            gathered.setdefault(w["parent"], None)
+            pieces.setdefault(w["parent"], []).append(w)
+        else:
+            gathered[w["id"]] = results[w["id"]]
+    for parent, chunks in pieces.items():
+        gathered[parent] = stitch([results[c["id"]] for c in chunks], chunks)
+    return gathered
+
+
+def siblings(workables) -> dict:
+    """The chunks of each split workable keyed by the id of every chunk, so a chunk can find the rest"""
+    pieces = {}
+    for w in workables:
+        if isinstance(w, dict) and "parent" in w:
+            pieces.setdefault(w["parent"], []).append(w)
+    return {c["id"]: chunks for chunks in pieces.values() for c in chunks}
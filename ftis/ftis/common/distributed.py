@@ -0,0 +1,257 @@
+"""
+Spread the workables of a node across machines with nothing more than a shared filesystem.
+
+The coordinator (a World created with queue=...) submits the workables of each node to a SQLite
+database that every host can reach. Workers started with `ftis worker <queue>` claim tasks, run
+them with the same analyser and parameters and commit the results back to the database. Claims
+expire after a lease so tasks held by a worker that died are picked up again.
+"""
+
+import os
+import time
+import pickle
+import socket
+import sqlite3
+from contextlib import contextmanager
+from importlib import import_module
+from pathlib import Path
+from types import SimpleNamespace
+from ftis.common.exceptions import TaskFailed
+
+# Attributes that belong to the coordinator rather than to the analyser
+local_keys = ("process", "parent", "chain", "buffer", "pre", "post")
+
+
+def portable_state(node) -> dict:
+    """The attributes of a node that can be shipped to a worker"""
+    state = {}
+    for k, v in vars(node).items():
+        if k in local_keys:
+            continue
+        try:
+            pickle.dumps(v)
+        except Exception:
+            continue
+        state[k] = v
+    return state
+
+
+def portable_corpus(node, workables) -> dict:
+    """The entries of the corpus index and the aliases that the workables of a node refer to"""
+    if not hasattr(node, "corpus"):
+        return {}
+    files = {str(w["file"] if isinstance(w, dict) else w) for w in workables}
+    return {
+        "index": {k: v for k, v in node.corpus_index().items() if k in files},
+        "aliases": {k: v for k, v in node.aliases().items() if k in files},
+    }
+
+
+class WorkQueue:
+    def __init__(self, path, lease: float = 600.0, attempts: int = 3):
+        self.path = Path(path).expanduser().resolve()
+        self.lease = lease  # seconds before a claimed task is handed to someone else
+        self.attempts = attempts
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        with self.connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                job TEXT PRIMARY KEY, module TEXT, cls TEXT, method TEXT, state BLOB, world BLOB)""")
+            db.execute("""CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY, job TEXT, workable BLOB, status TEXT DEFAULT 'pending',
+                worker TEXT, claimed REAL, attempts INTEGER DEFAULT 0, result BLOB, error TEXT)""")
+            db.execute("CREATE INDEX IF NOT EXISTS task_status ON tasks (status, job)")
+
+    @contextmanager
+    def connect(self):
+        # autocommit, transactions are opened explicitly where claims need to be atomic
+        db = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def submit(self, node, method: str, workables) -> str:
+        """
+        Queue one task per workable for this node and method.
+        Tasks that already finished for the same workables are kept, everything else is replaced.
+        """
+        job = f"{node.identity['hash']}.{method}"
+        workables = list(workables)
+        world = {
+            "sink": node.process.sink,
+            "cache": node.process.cache,
+            "workers": node.process.workers,
+            "corpus": portable_corpus(node, workables),
+        }
+        workables = dict.fromkeys(pickle.dumps(w) for w in workables)
+        with self.connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM tasks WHERE job = ? AND status != 'done'", (job,))
+            for task, workable in db.execute(
+                "SELECT id, workable FROM tasks WHERE job = ?", (job,)
+            ).fetchall():
+                if workable in workables:
+                    del workables[workable]
+                else:
+                    db.execute("DELETE FROM tasks WHERE id = ?", (task,))
+            db.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    job,
+                    node.__class__.__module__,
+                    node.__class__.__name__,
+                    method,
+                    pickle.dumps(portable_state(node)),
+                    pickle.dumps(world),
+                ),
+            )
+            db.executemany("INSERT INTO tasks (job, workable) VALUES (?, ?)", ((job, w) for w in workables))
+            db.execute("COMMIT")
+        return job
+
+    def claim(self, job: str = None):
+        """
+        Claim the next pending (or abandoned) task, optionally only from one job.
+        A task whose claim has expired as many times as it may be attempted is marked failed instead.
+        """
+        expired = time.time() - self.lease
+        query = (
+            "SELECT id, job, workable FROM tasks WHERE "
+            "(status = 'pending' OR (status = 'claimed' AND claimed < ?))"
+        )
+        params = [expired]
+        if job is not None:
+            query += " AND job = ?"
+            params.append(job)
+        with self.connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE tasks SET status = 'failed', error = ? "
+                "WHERE status = 'claimed' AND claimed < ? AND attempts >= ?",
+                (f"claim expired after {self.attempts} attempts", expired, self.attempts),
+            )
+            row = db.execute(query + " ORDER BY id LIMIT 1", params).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE tasks SET status = 'claimed', worker = ?, claimed = ?, attempts = attempts + 1 WHERE id = ?",
+                    (self.worker, time.time(), row[0]),
+                )
+            db.execute("COMMIT")
+        if row is None:
+            return None
+        return row[0], row[1], pickle.loads(row[2])
+
+    def complete(self, task: int, result: dict) -> None:
+        with self.connect() as db:
+            db.execute(
+                "UPDATE tasks SET status = 'done', result = ? WHERE id = ? AND worker = ?",
+                (pickle.dumps(result), task, self.worker),
+            )
+
+    def fail(self, task: int, error: str) -> None:
+        with self.connect() as db:
+            db.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, error = ? "
+                "WHERE id = ? AND worker = ?",
+                (self.attempts, error, task, self.worker),
+            )
+
+    def progress(self, job: str) -> dict:
+        with self.connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM tasks WHERE job = ? GROUP BY status", (job,))
+            return dict(rows.fetchall())
+
+    def results(self, job: str):
+        with self.connect() as db:
+            for (result,) in db.execute("SELECT result FROM tasks WHERE job = ? AND status = 'done'", (job,)):
+                yield pickle.loads(result)
+
+    def errors(self, job: str) -> list:
+        with self.connect() as db:
+            return [
+                e
+                for (e,) in db.execute("SELECT error FROM tasks WHERE job = ? AND status = 'failed'", (job,))
+            ]
+
+    def load(self, job: str):
+        """Recreate the analyser of a job inside a worker"""
+        from ftis.world import World
+
+        with self.connect() as db:
+            module, cls, method, state, world = db.execute(
+                "SELECT module, cls, method, state, world FROM jobs WHERE job = ?", (job,)
+            ).fetchone()
+        world = pickle.loads(world)
+        process = World(sink=world["sink"], quiet=True, workers=world["workers"])
+        process.cache = world["cache"]
+        cls = getattr(import_module(module), cls)
+        node = cls.__new__(cls)
+        node.__dict__.update(pickle.loads(state))
+        node.process = process
+        # stands in for the corpus so microcache keys and aliases match those of the coordinator
+        node.parent = SimpleNamespace(**world.get("corpus", {}))
+        return getattr(node, method)
+
+
+def execute(queue: WorkQueue, job: str, task: int, workable, process) -> None:
+    """Run a single task, committing whatever the analyser put in its buffer"""
+    process.__self__.buffer = {}
+    try:
+        process(workable)
+    except Exception as e:
+        queue.fail(task, f"{e.__class__.__name__}: {e}")
+    else:
+        queue.complete(task, dict(process.__self__.buffer))
+
+
+def work(queue: WorkQueue, poll: float = 1.0, idle: float = None) -> int:
+    """Claim and run tasks until there have been none for idle seconds (forever when idle is None)"""
+    jobs = {}
+    done = 0
+    waiting = time.monotonic()
+    while True:
+        claimed = queue.claim()
+        if claimed is None:
+            if idle is not None and time.monotonic() - waiting > idle:
+                return done
+            time.sleep(poll)
+            continue
+        task, job, workable = claimed
+        if job not in jobs:
+            jobs[job] = queue.load(job)
+        execute(queue, job, task, workable, jobs[job])
+        done += 1
+        waiting = time.monotonic()
+
+
+def distribute(name: str, process, workables, progress, task) -> None:
+    """
+    Run the workables of a node through the queue of its world.
+    The coordinator works through tasks as well so a run completes without any workers attached.
+    """
+    node = process.__self__
+    queue = node.process.queue
+    job = queue.submit(node, process.__name__, workables)
+    buffer = getattr(node, "buffer", None)
+    node.buffer = {}
+
+    while True:
+        claimed = queue.claim(job)
+        if claimed is not None:
+            execute(queue, job, claimed[0], claimed[2], process)
+        counts = queue.progress(job)
+        progress.update(task, completed=counts.get("done", 0) + counts.get("failed", 0))
+        if counts.get("pending", 0) + counts.get("claimed", 0) == 0:
+            break
+        if claimed is None:
+            time.sleep(0.5)  # everything left is claimed by workers
+
+    node.buffer = buffer
+    errors = queue.errors(job)
+    if errors:
+        raise TaskFailed(name, errors)
+    if buffer is not None:
+        for result in queue.results(job):
+            for k, v in result.items():
+                buffer[k] = v
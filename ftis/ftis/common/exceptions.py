@@ -57,3 +57,13 @@ class SourceIOError(Exception):
 class EmptyWorkables(Exception):
     def __init__(self):
         super().__init__(f"No workables were passed to the proc")
+
+
+class TaskFailed(Exception):
+    def __init__(self, name: str, errors: list):
+        super().__init__(f"{len(errors)} {name} tasks failed, the first with {errors[0]}")
+
+
+class StreamAborted(Exception):
+    def __init__(self):
+        super().__init__("The parent of a streaming node failed before it finished")
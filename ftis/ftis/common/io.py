@@ -1,8 +1,8 @@
 import soundfile as sf
-import audioread
 from typing import Union, Tuple, List
 from pathlib import Path
 import json
+import os
 
 
 def write_json(json_file_path: str, in_dict: dict) -> None:
@@ -41,5 +41,22 @@ def get_sr(path: Union[str, Path]) -> int:
         with sf.SoundFile(path) as f:
             return int(f.samplerate)
     except RuntimeError:
+        import audioread
+
         with audioread.audio_open(path) as f:
             return int(f.samplerate)
+
+
+def get_info(path: Union[str, Path]) -> dict:
+    """Header level description of an audio file, cheap enough to detect changes between runs"""
+    stat = os.stat(path)
+    info = {"size": stat.st_size, "mtime": stat.st_mtime}
+    try:
+        header = sf.info(str(path))
+        info.update(frames=header.frames, samplerate=header.samplerate, channels=header.channels)
+    except RuntimeError:
+        import audioread
+
+        with audioread.audio_open(str(path)) as f:
+            info.update(frames=int(f.duration * f.samplerate), samplerate=f.samplerate, channels=f.channels)
+    return info
@@ -0,0 +1,89 @@
+import os
+from threading import Thread, Condition
+
+
+def warm(workable) -> None:
+    """Ask the kernel to start reading a file into the page cache without waiting for it"""
+    path = workable["file"] if isinstance(workable, dict) else workable
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except (AttributeError, OSError):  # not available on macOS
+        pass
+    finally:
+        os.close(fd)
+    return None
+
+
+def nbytes(data) -> int:
+    if isinstance(data, (tuple, list)):
+        return sum(nbytes(x) for x in data)
+    return getattr(data, "nbytes", 0)
+
+
+class Prefetcher(Thread):
+    """
+    Loads upcoming workables on a background thread while the current ones are processed.
+    At most ahead workables, and budget bytes of loaded data, are held at once. Workables that a
+    worker reaches before the prefetcher are skipped by it and loaded by the worker instead.
+    A load that only warms the page cache returns None, holds nothing and is counted in warmed.
+    """
+
+    def __init__(self, workables, load, key, ahead: int = 4, budget: int = 256_000_000):
+        super().__init__(daemon=True)
+        self.workables = list(workables)
+        self.load = load
+        self.key = key
+        self.ahead = ahead
+        self.budget = budget
+        self.ready = {}
+        self.taken = set()
+        self.held = 0
+        self.warmed = 0
+        self.stopped = False
+        self.condition = Condition()
+
+    def full(self) -> bool:
+        return len(self.ready) >= self.ahead or (self.ready and self.held >= self.budget)
+
+    def run(self):
+        for workable in self.workables:
+            key = self.key(workable)
+            with self.condition:
+                self.condition.wait_for(lambda: self.stopped or not self.full())
+                if self.stopped:
+                    return
+                if key in self.taken:
+                    continue
+            try:
+                data = self.load(workable)
+            except Exception:
+                continue  # the worker loads it again and reports the error
+            with self.condition:
+                if data is None:  # nobody takes a warmed file, a slot held for it would never free
+                    self.warmed += 1
+                    continue
+                if key in self.taken:
+                    continue
+                self.ready[key] = data
+                self.held += nbytes(data)
+
+    def take(self, key):
+        """The loaded data for key, or None when the prefetcher has not got to it yet"""
+        with self.condition:
+            self.taken.add(key)
+            if key not in self.ready:
+                return None
+            data = self.ready.pop(key)
+            self.held -= nbytes(data)
+            self.condition.notify_all()
+            return data
+
+    def stop(self) -> None:
+        with self.condition:
+            self.stopped = True
+            self.ready.clear()
+            self.condition.notify_all()
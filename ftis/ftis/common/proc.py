@@ -1,6 +1,88 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+from itertools import islice
+from contextlib import nullcontext, contextmanager
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from rich.progress import Progress, BarColumn
 from ftis.common.exceptions import EmptyWorkables
+from ftis.common.distributed import distribute
+
+
+_live = Lock()  # rich can only show one live display at a time
+
+
+@contextmanager
+def progress_bar(*columns):
+    """A progress bar, hidden when nodes running side by side on other threads already show one"""
+    shown = _live.acquire(blocking=False)
+    try:
+        with Progress(*columns, disable=not shown) as progress:
+            yield progress
+    finally:
+        if shown:
+            _live.release()
+
+
+def world_of(process):
+    """The world that a bound analyser method belongs to, if any"""
+    return getattr(getattr(process, "__self__", None), "process", None)
+
+
+def prefetching(node, workables):
+    """Read workables ahead of the workers when the analyser knows how to"""
+    return node.prefetcher(workables) if hasattr(node, "prefetcher") else nullcontext()
+
+
+def distributed(process) -> bool:
+    return getattr(world_of(process), "queue", None) is not None
+
+
+def chunked(workables, size: int, costs: list = None, budget: float = None):
+    """Chunks of at most size workables, closed early once the cost of a chunk reaches budget"""
+    if costs is None or not budget:
+        workables = iter(workables)
+        while True:
+            chunk = list(islice(workables, size))
+            if not chunk:
+                return
+            yield chunk
+    chunk, spent = [], 0.0
+    for work, cost in zip(workables, costs):
+        chunk.append(work)
+        spent += cost
+        if len(chunk) >= size or spent >= budget:
+            yield chunk
+            chunk, spent = [], 0.0
+    if chunk:
+        yield chunk
+
+
+def run_chunk(process, chunk: list) -> list:
+    return [process(work) for work in chunk]
+
+
+def imap(process, workables, workers: int = None, window: int = None, chunksize: int = 1, costs: list = None):
+    """
+    Yield the results of process over workables as they complete.
+    Workables are submitted chunksize at a time with at most window chunks in flight, so memory stays
+    flat however many workables there are and tiny tasks share the cost of scheduling.
+    Given the cost of each workable, expensive workables are not batched together.
+    """
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    window = window or workers * 4
+    budget = sum(costs) / (workers * 32) if costs else None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for chunk in chunked(workables, chunksize, costs, budget):
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+            pending.add(pool.submit(run_chunk, process, chunk))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
 
 
 def multiproc(name: str, process, workables:list):
@@ -8,11 +90,22 @@ def multiproc(name: str, process, workables:list):
     if len(workables) == 0:
         raise EmptyWorkables
 
-    with Progress() as progress:
+    world = world_of(process)
+    node = getattr(process, "__self__", None)
+    costs = None
+    if hasattr(node, "schedule"):
+        workables, costs = node.schedule(workables)
+    workers = getattr(world, "workers", None) or min(32, (os.cpu_count() or 1) + 4)
+    # Aim for a few dozen chunks per thread so progress stays smooth and the pool stays busy
+    chunksize = getattr(world, "chunksize", None) or max(1, min(64, len(workables) // (workers * 32)))
+    with progress_bar() as progress:
         task = progress.add_task(name, total=len(workables))
-        with ThreadPoolExecutor() as pool:
-            futures = [pool.submit(process, work) for work in workables]
-            for result in as_completed(futures):
+        if distributed(process):
+            return distribute(name, process, workables, progress, task)
+        if hasattr(node, "timed"):
+            process = node.timed(process)
+        with prefetching(node, workables):
+            for _ in imap(process, workables, workers, getattr(world, "window", None), chunksize, costs):
                 progress.update(task, advance=1)
 
 
@@ -21,15 +114,23 @@ def singleproc(name: str, process, workables):
     if len(workables) == 0:
         raise EmptyWorkables
 
-    with Progress() as progress:
+    node = getattr(process, "__self__", None)
+    with progress_bar() as progress:
         task = progress.add_task(name, total=len(workables))
-        for x in workables:
-            process(x)
-            progress.update(task, advance=1)
+        if distributed(process):
+            if hasattr(node, "schedule"):
+                workables, _ = node.schedule(workables)
+            return distribute(name, process, workables, progress, task)
+        if hasattr(node, "timed"):
+            process = node.timed(process)
+        with prefetching(node, workables):
+            for x in workables:
+                process(x)
+                progress.update(task, advance=1)
 
 
 def staticproc(name: str, process):
     """For processes where progress can not be determined"""
-    with Progress(f"[magenta]{name}...", BarColumn()) as progress:
+    with progress_bar(f"[magenta]{name}...", BarColumn()) as progress:
         task = progress.add_task(name, start=False)
         process()
@@ -0,0 +1,147 @@
+import sys
+import time
+import cProfile
+import resource
+import threading
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def peak_rss() -> int:
+    """High-water mark of the resident set size over the lifetime of this process (or its finished children) in bytes"""
+    scale = 1 if sys.platform == "darwin" else 1024  # linux reports kilobytes
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+
+def current_rss() -> int:
+    """Resident set size of this process right now in bytes, None where the platform cannot tell us"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class RSSSampler(threading.Thread):
+    """Samples the resident set size while a phase runs to find how far it grew above where it started"""
+
+    def __init__(self, interval: float = 0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.start_rss = current_rss()
+        self.start_peak = peak_rss()
+        self.highest = self.start_rss
+        self.stopped = threading.Event()
+
+    def sample(self) -> None:
+        rss = current_rss()
+        if rss is not None and rss > self.highest:
+            self.highest = rss
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def increase(self) -> int:
+        """Bytes the phase added at its peak, from samples or, without /proc, from the growth of the high-water mark"""
+        self.stopped.set()
+        if self.start_rss is None:
+            return peak_rss() - self.start_peak
+        self.sample()
+        return self.highest - self.start_rss
+
+
+def cpu_time() -> float:
+    """CPU seconds used by this process and its children (the flucoma command line tools)"""
+    times = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return sum(t.ru_utime + t.ru_stime for t in times)
+
+
+def io_counters() -> tuple:
+    """Bytes read and written by this process, zero where the platform cannot tell us"""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+@contextmanager
+def measure(phases: dict, name: str):
+    """
+    Record wall time, cpu time, memory and bytes moved for the enclosed phase.
+    rss_increase is how far the resident set grew during the phase, process_peak_rss the lifetime peak.
+    """
+    wall, cpu, (read, written) = time.perf_counter(), cpu_time(), io_counters()
+    sampler = RSSSampler()
+    if sampler.start_rss is not None:
+        sampler.start()
+    try:
+        yield
+    finally:
+        end_read, end_written = io_counters()
+        phases[name] = {
+            "wall": time.perf_counter() - wall,
+            "cpu": cpu_time() - cpu,
+            "rss_increase": sampler.increase(),
+            "process_peak_rss": peak_rss(),
+            "read_bytes": end_read - read,
+            "written_bytes": end_written - written,
+        }
+
+
+class Sampler(threading.Thread):
+    """Periodically samples the stacks of every thread and counts them in collapsed (flamegraph) form"""
+
+    def __init__(self, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = traceback.extract_stack(frame)
+                self.stacks[";".join(f"{f.name} ({Path(f.filename).name}:{f.lineno})" for f in stack)] += 1
+
+    def write(self, path: Path) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profiled(kind, path: Path):
+    """
+    Optionally profile the enclosed block.
+    "cprofile" profiles the calling thread and writes pstats to path.prof
+    "sample" samples every thread (including proc workers) and writes collapsed stacks to path.stacks
+    """
+    if not kind:
+        yield
+    elif kind == "sample":
+        sampler = Sampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stopped.set()
+            sampler.join()
+            sampler.write(path.with_suffix(".stacks"))
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path.with_suffix(".prof"))
@@ -0,0 +1,114 @@
+"""
+A content addressed store of node outputs shared by every world on a machine, or by a team when it
+lives on a shared filesystem.
+
+An artifact is keyed by the identity hash of a node and a fingerprint of the input it was given, so
+a node is only reused for exactly the input it was computed on. Artifacts are written to a temporary
+folder and moved into place with os.replace, so a reader never sees one half written, and a lockfile
+stops two worlds publishing the same artifact at once.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+from pathlib import Path
+from ftis.common.types import FTISType
+from ftis.common.utils import create_hash, fingerprint
+
+
+def default_root() -> Path:
+    return Path(os.environ.get("FTIS_STORE", "~/.ftis/store")).expanduser().resolve()
+
+
+def input_fingerprint(container, index: dict = None) -> str:
+    """A hash of the input of a node, using the corpus index or the size and mtime of files it lists"""
+    index = index or {}
+    if isinstance(container, FTISType):
+        container = container.data
+    if isinstance(container, dict):
+        return create_hash(sorted(fingerprint(container).items()))
+    described = []
+    for x in sorted(str(x) for x in container):
+        info = index.get(x)
+        if info is None and os.path.isfile(x):
+            stat = os.stat(x)
+            info = {"size": stat.st_size, "mtime": stat.st_mtime}
+        described.append((x, info))
+    return create_hash(described)
+
+
+def copy(source: Path, destination: Path) -> None:
+    """Copy a file so that the destination is replaced in one step"""
+    destination.parent.mkdir(exist_ok=True, parents=True)
+    fd, tmp = tempfile.mkstemp(dir=destination.parent, prefix=f".{destination.name}.")
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, destination)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class ArtifactStore:
+    def __init__(self, root=None, stale: float = 3600.0):
+        self.root = Path(root).expanduser().resolve() if root else default_root()
+        self.stale = stale  # seconds after which the lock of a publisher that died is broken
+        self.root.mkdir(exist_ok=True, parents=True)
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def __contains__(self, key: str) -> bool:
+        return self.path(key).is_dir()
+
+    def folder(self, name: str) -> Path:
+        """A shared folder for analysers that write files, such as collapsed audio"""
+        folder = self.root / "files" / name
+        folder.mkdir(exist_ok=True, parents=True)
+        return folder
+
+    def fetch(self, key: str, files: dict) -> bool:
+        """Copy the files of an artifact to their destinations, by name, returning whether it was found"""
+        artifact = self.path(key)
+        if not artifact.is_dir():
+            return False
+        for name, destination in files.items():
+            if (artifact / name).exists():
+                copy(artifact / name, Path(destination))
+        return True
+
+    def lock(self, key: str) -> bool:
+        lockfile = self.path(key).with_suffix(".lock")
+        lockfile.parent.mkdir(exist_ok=True, parents=True)
+        for _ in range(2):
+            try:
+                os.close(os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - lockfile.stat().st_mtime < self.stale:
+                        return False
+                    lockfile.unlink()
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def publish(self, key: str, files: dict) -> bool:
+        """Add the existing files to the store under key unless it is already there or being written"""
+        if key in self or not self.lock(key):
+            return False
+        artifact = self.path(key)
+        tmp = Path(tempfile.mkdtemp(dir=artifact.parent, prefix=f".{key}."))
+        try:
+            for name, source in files.items():
+                if source is not None and Path(source).exists():
+                    shutil.copyfile(source, tmp / name)
+            os.replace(tmp, artifact)
+        except OSError:
+            return False  # published by someone who ignored the lock, the artifact is the same
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+            artifact.with_suffix(".lock").unlink(missing_ok=True)
+        return True
@@ -0,0 +1,58 @@
+from queue import Queue
+from ftis.common.exceptions import StreamAborted
+
+_closed = object()
+
+
+class Stream:
+    """
+    The output of a parent node as it is produced, used as the input of a streaming child.
+    Iterating blocks until the next item arrives and stops when the parent has finished.
+    The queue is bounded so a parent that runs ahead of its children is held back.
+    """
+
+    def __init__(self, size: int = 256):
+        self.data = {}
+        self.queue = Queue(maxsize=size)
+        self.abandoned = False
+
+    def put(self, key, value) -> None:
+        if not self.abandoned:
+            self.queue.put((key, value))
+
+    def abandon(self) -> None:
+        """Called by a consumer that failed so that the parent is not left blocking on a full queue"""
+        self.abandoned = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def close(self, failed: bool = False) -> None:
+        self.queue.put((_closed, failed))
+
+    def __iter__(self):
+        while True:
+            key, value = self.queue.get()
+            if key is _closed:
+                if value:
+                    raise StreamAborted
+                return
+            self.data[key] = value
+            yield key
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        return self.data.values()
+
+    def items(self):
+        return self.data.items()
@@ -1,4 +1,6 @@
 from dataclasses import dataclass, field
+import numpy as np
+from pathlib import Path
 
 @dataclass
 class FTISType:
@@ -30,3 +32,169 @@ class AudioFiles(FTISType):
 @dataclass
 class Data(FTISType):
     ext:str = ".json"
+
+@dataclass(eq=False)
+class FeatureStore(FTISType):
+    """
+    Frame level features for every item packed into one contiguous float32 buffer.
+    data maps each key to a NumPy view into the buffer (shaped like the item, e.g. bands x frames)
+    so a store reads like any other output while using 4 bytes per value.
+    """
+    ext:str = ".npz"
+
+    def __post_init__(self):
+        arrays = {k: np.asarray(v, dtype=np.float32) for k, v in self.data.items()}
+        offsets = np.cumsum([0] + [a.size for a in arrays.values()])
+        buffer = np.empty(offsets[-1], dtype=np.float32)
+        for a, start, end in zip(arrays.values(), offsets, offsets[1:]):
+            buffer[start:end] = a.ravel()
+        self.adopt(list(arrays), buffer, offsets, [a.shape for a in arrays.values()])
+
+    def adopt(self, keys: list, buffer: np.ndarray, offsets: np.ndarray, shapes: list) -> None:
+        self.buffer = buffer
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.data = {
+            k: buffer[start:end].reshape(shape)
+            for k, start, end, shape in zip(keys, self.offsets, self.offsets[1:], shapes)
+        }
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        return self.data.values()
+
+    def items(self):
+        return self.data.items()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(v.nbytes for v in self.data.values())
+
+    def save(self, path) -> None:
+        # Repack so that items merged in from other stores are written contiguously
+        store = FeatureStore(self.data)
+        shapes = [v.shape for v in store.data.values()]
+        np.savez(
+            path,
+            keys=np.array(list(store.data), dtype=str),
+            buffer=store.buffer,
+            offsets=store.offsets,
+            ndims=np.array([len(s) for s in shapes], dtype=np.int64),
+            dims=np.array([d for s in shapes for d in s], dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path) -> "FeatureStore":
+        with np.load(path) as f:
+            ndims, dims = f["ndims"], f["dims"].tolist()
+            bounds = np.cumsum(np.concatenate([[0], ndims]))
+            shapes = [tuple(dims[start:end]) for start, end in zip(bounds, bounds[1:])]
+            store = cls()
+            store.adopt(f["keys"].tolist(), f["buffer"], f["offsets"], shapes)
+        return store
+
+
+def item_keys(container) -> list:
+    """The keys of a mapping like output, or the items of a list like one"""
+    if isinstance(container, FTISType):
+        container = container.data
+    if isinstance(container, dict):
+        return list(container.keys())
+    return list(container)
+
+
+def subset(container, keep: set):
+    """Return a container of the same type holding only the keys (as strings) in keep"""
+    if isinstance(container, FTISType):
+        return type(container)(subset(container.data, keep))
+    if isinstance(container, dict):
+        return {k: v for k, v in container.items() if str(k) in keep}
+    return [x for x in container if str(x) in keep]
+
+
+def alias_of(key: str, aliases: dict) -> tuple:
+    """The representative a key belongs to and the suffix after it, e.g. the slice number"""
+    if key in aliases:
+        return key, ""
+    for sep in ("_", "@"):
+        root, _, suffix = key.rpartition(sep)
+        if root in aliases:
+            return root, sep + suffix
+    return None, None
+
+
+def keylist(value) -> bool:
+    """Whether a value is a list of item keys, such as the members of a cluster, rather than data"""
+    return isinstance(value, list) and len(value) > 0 and all(isinstance(x, (str, Path)) for x in value)
+
+
+def parallel(container) -> bool:
+    """Whether a container is a compact output of parallel keys and labels rather than a mapping"""
+    return isinstance(container, dict) and set(container) == {"keys", "labels"}
+
+
+def fan_out(container, aliases: dict):
+    """
+    Return a container where every result of a representative is repeated for each of its aliases.
+    Keys are fanned out as are lists of items inside values, such as the members of a cluster.
+    """
+    if not aliases:
+        return container
+    if isinstance(container, FTISType):
+        return type(container)(fan_out(container.data, aliases))
+    if parallel(container):
+        keys, labels = list(container["keys"]), list(container["labels"])
+        for key, label in zip(container["keys"], container["labels"]):
+            root, suffix = alias_of(str(key), aliases)
+            if root is not None:
+                keys += [alias + suffix for alias in aliases[root]]
+                labels += [label] * len(aliases[root])
+        return {"keys": keys, "labels": labels}
+    if isinstance(container, dict):
+        fanned = {}
+        for k, v in container.items():
+            v = fan_out(v, aliases) if keylist(v) else v
+            fanned[k] = v
+            root, suffix = alias_of(str(k), aliases)
+            if root is not None:
+                for alias in aliases[root]:
+                    fanned[alias + suffix] = v
+        return fanned
+    if isinstance(container, (list, set)) and keylist(list(container)):
+        fanned = list(container) + [
+            type(x)(a) for x in container if str(x) in aliases for a in aliases[str(x)]
+        ]
+        return type(container)(fanned)
+    return container
+
+
+def fold_in(container, aliases: dict):
+    """Undo fan_out, dropping the results of aliases so that only representatives are left"""
+    if not aliases:
+        return container
+    duplicates = dict.fromkeys(a for group in aliases.values() for a in group)
+    if isinstance(container, FTISType):
+        return type(container)(fold_in(container.data, aliases))
+    if parallel(container):
+        kept = [
+            (k, label)
+            for k, label in zip(container["keys"], container["labels"])
+            if alias_of(str(k), duplicates)[0] is None
+        ]
+        return {"keys": [k for k, _ in kept], "labels": [label for _, label in kept]}
+    if isinstance(container, dict):
+        return {
+            k: fold_in(v, aliases) if keylist(v) else v
+            for k, v in container.items()
+            if alias_of(str(k), duplicates)[0] is None
+        }
+    if isinstance(container, (list, set)) and keylist(list(container)):
+        return type(container)(x for x in container if str(x) not in duplicates)
+    return container
@@ -1,3 +1,4 @@
+import os
 import hashlib
 import numpy as np
 from pathlib import Path
@@ -25,10 +26,71 @@ def create_hash(*items) -> str:
         m.update(str(item).encode("utf-8"))
     return m.hexdigest()
 
+
+def fingerprint(data: dict) -> dict:
+    """Hash every value of a feature table so that tables can be compared between runs"""
+    return {k: create_hash(v.tobytes() if isinstance(v, np.ndarray) else v) for k, v in data.items()}
+
+
+def diff(previous: dict, current: dict) -> tuple:
+    """Return the keys added, removed and changed between two fingerprint tables"""
+    added = [k for k in current if k not in previous]
+    removed = [k for k in previous if k not in current]
+    changed = [k for k in current if k in previous and previous[k] != current[k]]
+    return added, removed, changed
+
+def sampled_hash(path, block: int = 65536) -> str:
+    """Hash the start, middle and end of a file, enough to tell most files of the same size apart"""
+    m = hashlib.blake2b(digest_size=20)
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - block // 2), max(0, size - block)}):
+            f.seek(offset)
+            m.update(f.read(block))
+    return m.hexdigest()
+
+
+def file_hash(path, block: int = 1 << 20) -> str:
+    m = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            m.update(chunk)
+    return m.hexdigest()
+
+
+def find_duplicates(paths: list) -> dict:
+    """
+    Group byte identical files, returning the aliases of each file that has any.
+    Files are compared by size, then by a sampled hash and only then by hashing them in full.
+    The first path of each group is kept as its representative.
+    """
+    by_size = {}
+    for p in paths:
+        by_size.setdefault(os.path.getsize(p), []).append(p)
+    aliases = {}
+    for group in by_size.values():
+        if len(group) < 2:
+            continue
+        candidates = {}
+        for p in group:
+            candidates.setdefault(sampled_hash(p), []).append(p)
+        for candidate in candidates.values():
+            if len(candidate) < 2:
+                continue
+            confirmed = {}
+            for p in candidate:
+                confirmed.setdefault(file_hash(p), []).append(p)
+            for same in confirmed.values():
+                if len(same) > 1:
+                    aliases[same[0]] = same[1:]
+    return aliases
+
+
 ignored_keys = (  # keys to ignore from superclass
     "process",
     "dump_path",
     "model_dump",
+    "model",
     "input",
     "output",
     "input_type",
@@ -38,5 +100,8 @@ ignored_keys = (  # keys to ignore from superclass
     "corpus_items",
     "buffer",
     "pre", "post",
-    "scripting", "chain", "parent", "parent_string"
+    "scripting", "chain", "parent", "parent_string",
+    "fresh", "index", "profile", "microcache_stats", "streams",
+    "frames", "timings", "prefetch", "pool", "variant", "tag",
+    "order", "suborder"  # where a node sits in the graph, so identical siblings hash the same
 )
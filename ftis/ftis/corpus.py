@@ -1,10 +1,11 @@
+import os
 import numpy as np
 from pathlib import Path
 from ftis.common.exceptions import NoCorpusSource, InvalidSource
 from ftis.common.analyser import FTISAnalyser
 from ftis.common.proc import singleproc
-from ftis.common.io import write_json, read_json, get_duration
-from ftis.common.utils import create_hash
+from ftis.common.io import write_json, read_json, get_duration, get_info
+from ftis.common.utils import create_hash, find_duplicates
 from ftis.common.types import AudioFiles
 from flucoma.utils import get_buffer
 from flucoma.fluid import stats, loudness
@@ -21,10 +22,31 @@ class Corpus:
         self.is_filtering: bool = False
         self.chain = {}
         self.identity = {}
+        self.index = {}
+        self.fresh = None  # items added or changed since the last run, None when unknown
+        self.aliases = {}  # duplicates of an item that share its results instead of being analysed
         self.get_items()
 
     def create_identity(self):
-        self.identity["hash"] = create_hash(self.items, self.is_filtering, self.path, self.file_type)
+        # leaves the hash of corpora without duplicates as it was
+        aliases = [self.aliases] if self.aliases else []
+        self.identity["hash"] = create_hash(
+            self.items, self.is_filtering, self.path, self.file_type, *aliases
+        )
+        self.identity["lineage"] = create_hash(self.is_filtering, self.path, self.file_type)
+
+    def build_index(self, previous: dict = None) -> dict:
+        """Describe every item, only reading headers for items that are new or modified"""
+        previous = previous or {}
+        index = {}
+        for x in self.items:
+            old = previous.get(str(x))
+            stat = os.stat(x)
+            if old and old["size"] == stat.st_size and old["mtime"] == stat.st_mtime:
+                index[str(x)] = old
+            else:
+                index[str(x)] = get_info(x)
+        return index
 
     def set_dump(self):
         # FIXME this is called in build_connections but we dont need it
@@ -36,6 +58,7 @@ class Corpus:
     def __add__(self, right):
         try:
             self.items += right.items  # this is the fastest way to merge in place
+            self.aliases.update(right.aliases)
         except AttributeError:
             raise
         return self
@@ -46,9 +69,7 @@ class Corpus:
 
     def walk_chain(self) -> None:
         # Pass output to the input of all of connected things
-        for forward_connection in self.chain:
-            forward_connection.input = self.items
-            forward_connection.walk_chain()
+        self.process.walk(list(self.chain), self.items)
 
     def get_items(self) -> None:
         if self.path == "":
@@ -97,6 +118,17 @@ class Corpus:
             self.items = temp
         return self
 
+    def dedupe(self):
+        """Analyse byte identical files once, the results of each are copied to its duplicates"""
+        with Progress() as progress:
+            task = progress.add_task("[cyan]Corpus Filtering: Duplicates", total=1)
+            aliases = find_duplicates([str(x) for x in self.items])
+            progress.update(task, advance=1)
+        duplicates = {a for group in aliases.values() for a in group}
+        self.items = [x for x in self.items if str(x) not in duplicates]
+        self.aliases.update(aliases)
+        return self
+
     def loudness(self, min_loudness: int = 0, max_loudness: int = 100):
         hopsize = 4410
         windowsize = 17640
@@ -0,0 +1,270 @@
+import json
+import hashlib
+import argparse
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class NeighbourIndex:
+    """
+    A nearest neighbour index that maps its results back to corpus keys.
+    Keys can be added and removed without rebuilding the tree. Added points are
+    searched exhaustively and removed points are masked until the share of
+    either crosses the threshold, at which point the tree is rebuilt.
+    """
+
+    def __init__(self, keys, data, approximate=False, leafsize=40, neighbours=30, threshold=0.1, graph=None):
+        self.keys = [str(k) for k in keys]
+        self.data = np.asarray(data, dtype=np.float32)
+        self.approximate = approximate  # NNDescent graph for high dimensional features
+        self.leafsize = leafsize
+        self.neighbours = neighbours
+        self.threshold = threshold
+        self.build(graph)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return str(key) in self.rows
+
+    def build(self, graph=None) -> None:
+        """graph is a NeighbourGraph of the same data, used to start the descent from instead of random neighbours"""
+        if self.approximate:
+            from pynndescent import NNDescent
+
+            neighbours = min(self.neighbours, len(self.keys) - 1)
+            init = None
+            if graph is not None and graph.k >= neighbours:
+                init = graph.indices[:, :neighbours]
+            self.tree = NNDescent(
+                self.data,
+                n_neighbors=neighbours,
+                leaf_size=self.leafsize,
+                random_state=42,
+                init_graph=init,
+            )
+            self.tree.prepare()
+        else:
+            from sklearn.neighbors import KDTree as SKKDTree
+
+            self.tree = SKKDTree(self.data, leaf_size=self.leafsize)
+        self.built = len(self.keys)  # rows [0, built) live in the tree, the rest are appended
+        self.removed = set()
+        self.rows = {k: i for i, k in enumerate(self.keys)}
+
+    def rebuild(self) -> None:
+        live = sorted(self.rows.values())
+        self.keys = [self.keys[i] for i in live]
+        self.data = self.data[live]
+        self.build()
+
+    def imbalance(self) -> float:
+        """The share of rows that are not served by the tree"""
+        return (len(self.keys) - self.built + len(self.removed)) / max(self.built, 1)
+
+    def maybe_rebuild(self) -> bool:
+        if self.imbalance() > self.threshold:
+            self.rebuild()
+            return True
+        return False
+
+    def add(self, keys, data) -> None:
+        """Append points, replacing any that already exist under the same key"""
+        keys = [str(k) for k in keys]
+        self.remove([k for k in keys if k in self.rows])
+        start = len(self.keys)
+        self.keys += keys
+        self.data = np.vstack([self.data, np.asarray(data, dtype=np.float32).reshape(len(keys), -1)])
+        self.rows.update({k: start + i for i, k in enumerate(keys)})
+        self.maybe_rebuild()
+
+    def remove(self, keys) -> None:
+        for k in keys:
+            row = self.rows.pop(str(k), None)
+            if row is not None:
+                self.removed.add(row)
+        self.maybe_rebuild()
+
+    @staticmethod
+    def points(points) -> np.ndarray:
+        return np.atleast_2d(np.asarray(points, dtype=np.float32))
+
+    def appended(self, points) -> tuple:
+        """Exhaustive distances from each point to the live appended rows"""
+        rows = np.array([i for i in range(self.built, len(self.keys)) if i not in self.removed], dtype=int)
+        if len(rows) == 0:
+            return rows, np.empty((len(points), 0), dtype=np.float32)
+        return rows, np.linalg.norm(points[:, None, :] - self.data[rows][None, :, :], axis=-1)
+
+    def query(self, points, k=1) -> list:
+        """Return the k nearest (key, distance) pairs for each point"""
+        points = self.points(points)
+        searched = min(k + len(self.removed), self.built)
+        if self.approximate:
+            indices, distances = self.tree.query(points, k=searched)
+        else:
+            distances, indices = self.tree.query(points, k=searched)
+        rows, extra = self.appended(points)
+
+        results = []
+        for row_indices, row_distances, row_extra in zip(indices, distances, extra):
+            found = [(i, d) for i, d in zip(row_indices, row_distances) if i not in self.removed]
+            found += list(zip(rows, row_extra))
+            found.sort(key=lambda x: x[1])
+            results.append([(self.keys[i], float(d)) for i, d in found[:k]])
+        return results
+
+    def within(self, point, radius) -> list:
+        """Neighbours of one point within radius, doubling k until the farthest one found lies outside it"""
+        k = min(16, len(self))
+        while k:
+            found = self.query([point], k)[0]
+            if k >= len(self) or found[-1][1] > radius:
+                return [(key, d) for key, d in found if d <= radius]
+            k = min(k * 2, len(self))
+        return []
+
+    def radius(self, points, radius) -> list:
+        """
+        Return every (key, distance) pair within radius of each point.
+        The approximate index has no radius search, so it grows a k nearest query instead and can
+        miss neighbours the way its k nearest queries can.
+        """
+        points = self.points(points)
+        if self.approximate:
+            return [self.within(point, radius) for point in points]
+        indices, distances = self.tree.query_radius(points, r=radius, return_distance=True, sort_results=True)
+        rows, extra = self.appended(points)
+
+        results = []
+        for row_indices, row_distances, row_extra in zip(indices, distances, extra):
+            found = [(i, d) for i, d in zip(row_indices, row_distances) if i not in self.removed]
+            found += [(i, d) for i, d in zip(rows, row_extra) if d <= radius]
+            found.sort(key=lambda x: x[1])
+            results.append([(self.keys[i], float(d)) for i, d in found])
+        return results
+
+    def save(self, path) -> None:
+        from joblib import dump as jdump
+
+        jdump(self, path)
+
+    @staticmethod
+    def load(path) -> "NeighbourIndex":
+        from joblib import load as jload
+
+        return jload(path)
+
+
+class NeighbourGraph:
+    """
+    The k nearest neighbours of every row of a feature matrix, each row listing itself first.
+    Clustering and reduction nodes that hang off the same data share one graph instead of each
+    searching for neighbours again. Large, high dimensional data gets an approximate graph.
+    """
+
+    def __init__(self, indices, distances, approximate=False):
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.distances = np.asarray(distances, dtype=np.float32)
+        self.approximate = approximate
+
+    @property
+    def k(self) -> int:
+        return self.indices.shape[1]
+
+    @staticmethod
+    def key(data: np.ndarray) -> str:
+        m = hashlib.blake2b(digest_size=20)
+        m.update(str(data.shape).encode("utf-8"))
+        m.update(np.ascontiguousarray(data, dtype=np.float32).tobytes())
+        return m.hexdigest()
+
+    @classmethod
+    def build(cls, data: np.ndarray, k: int, approximate=None) -> "NeighbourGraph":
+        data = np.asarray(data, dtype=np.float32)
+        k = min(k, len(data))
+        if approximate is None:
+            approximate = len(data) > 20000 and data.shape[1] > 16
+        if approximate:
+            from pynndescent import NNDescent
+
+            indices, distances = NNDescent(data, n_neighbors=k, random_state=42).neighbor_graph
+        else:
+            from sklearn.neighbors import NearestNeighbors
+
+            distances, indices = NearestNeighbors(n_neighbors=k, n_jobs=-1).fit(data).kneighbors(data)
+        return cls(indices, distances, approximate)
+
+    def knn(self, k: int) -> tuple:
+        """Indices and distances of the first k neighbours, self included, as UMAP takes them"""
+        return self.indices[:, :k], self.distances[:, :k]
+
+    def sparse(self, k: int, binary: bool = False):
+        """The k neighbours of every row other than itself as a sparse matrix"""
+        from scipy.sparse import csr_matrix
+
+        n = len(self.indices)
+        indices, distances = self.knn(k + 1)
+        rows = np.repeat(np.arange(n), indices.shape[1])
+        keep = indices.ravel() != rows
+        values = np.ones(keep.sum(), dtype=np.float32) if binary else distances.ravel()[keep]
+        return csr_matrix((values, (rows[keep], indices.ravel()[keep])), shape=(n, n))
+
+    def connectivity(self, k: int):
+        """Like sklearn.neighbors.kneighbors_graph(data, k, include_self=False)"""
+        return self.sparse(k, binary=True)
+
+    def save(self, path) -> None:
+        np.savez(path, indices=self.indices, distances=self.distances, approximate=self.approximate)
+
+    @classmethod
+    def load(cls, path) -> "NeighbourGraph":
+        with np.load(path) as f:
+            return cls(f["indices"], f["distances"], bool(f["approximate"]))
+
+
+def serve(index: NeighbourIndex, host: str = "127.0.0.1", port: int = 8765) -> None:
+    """
+    Answer queries against an index over HTTP.
+    POST {"points": [[...]], "k": 5} or {"points": [[...]], "radius": 0.5}
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            try:
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if "radius" in request:
+                    results = index.radius(request["points"], request["radius"])
+                else:
+                    results = index.query(request["points"], request.get("k", 1))
+            except (KeyError, TypeError, ValueError) as e:
+                self.reply(400, {"error": str(e)})
+            else:
+                self.reply(200, {"results": results})
+
+        def reply(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a neighbour index dumped by the KDTree analyser")
+    parser.add_argument("index", type=str, help="Path to the .joblib index")
+    parser.add_argument("--host", default="127.0.0.1", type=str)
+    parser.add_argument("--port", default=8765, type=int)
+    args = parser.parse_args()
+    serve(NeighbourIndex.load(args.index), args.host, args.port)
@@ -1,3 +1,4 @@
+import os
 import datetime
 import logging
 from pathlib import Path
@@ -10,17 +11,58 @@ from ftis.common.io import write_json, read_json
 from ftis.common.utils import ignored_keys, create_hash
 from ftis.corpus import Corpus
 from shutil import rmtree
+from threading import Lock, Thread
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import product
+from ftis.common.exceptions import AnalyserParameterInvalid
 
 class World:
-    def __init__(self, sink=None, quiet=False, clear=False):
+    def __init__(
+        self,
+        sink=None,
+        quiet=False,
+        clear=False,
+        profile=None,
+        workers=None,
+        cache=None,
+        queue=None,
+        stream=False,
+        window=None,
+        chunksize=None,
+        split=300,
+        prefetch=4,
+        prefetch_budget=256_000_000,
+        store=None,
+        sweep_workers=None,
+    ):
         self.sink = Path(sink).expanduser().resolve()
         self.node_depth = 0
         # Input corpora objects
         self.corpora = []
         # Metadata
-        self.metadata = {"analyser" : {}}
+        self.metadata = {"analyser" : {}, "lineage" : {}, "corpora" : {}, "profile" : {}, "timings" : {}}
         self.prev_meta = None
         self.clear = clear
+        self.profile = profile  # profile every analyser with "cprofile" or "sample"
+        self.workers = workers  # threads used by multiproc, None lets the executor decide
+        self.window = window  # chunks multiproc keeps in flight, defaults to four per thread
+        self.chunksize = chunksize  # workables per task, None sizes chunks from the number of workables
+        self.split = split  # seconds above which analysers that support it cut a file into parallel chunks
+        self.prefetch = prefetch  # workables read ahead of the workers
+        self.prefetch_budget = prefetch_budget  # bytes of decoded audio the prefetcher may hold
+        self.cache_location = cache  # microcache folder, defaults to sink/.cache
+        self.queue_location = queue  # shared SQLite work queue for running across machines
+        self.queue = None
+        # Artifact store shared between sinks, a folder, True for FTIS_STORE or ~/.ftis/store, False for none
+        self.store_location = store
+        self.store = None
+        self.stream = stream  # per item children start on the output of their parent while it runs
+        self.stream_size = 256  # items a parent can get ahead of a streaming child
+        self.lock = Lock()
+        self.sweeps = []  # parameter sweeps, written to sink/sweeps.json after a run
+        self.sweep_workers = sweep_workers  # variants of a sweep that run at once, defaults to the cpu count
+        self.graphs = {}  # neighbour graphs of the feature matrices clustering and reduction nodes share
+        self.computed = {}  # futures of the nodes that ran, by identity hash, so identical nodes run once
         # Console
         self.console = Console()
         self.quiet = quiet
@@ -32,8 +74,30 @@ class World:
         self.sink.mkdir(exist_ok=True, parents=True)
         
         # Microcache
-        self.cache = self.sink / ".cache"
-        self.cache.mkdir(exist_ok=True)
+        if self.cache_location:
+            self.cache = Path(self.cache_location).expanduser().resolve()
+        else:
+            self.cache = self.sink / ".cache"
+        self.cache.mkdir(exist_ok=True, parents=True)
+
+        # Journals of per workable results for nodes that have not finished
+        self.checkpoints = self.sink / ".checkpoints"
+        self.checkpoints.mkdir(exist_ok=True)
+
+        # Seconds each workable took, kept out of the metadata so it stays small
+        self.timings = self.sink / ".timings"
+        self.timings.mkdir(exist_ok=True)
+
+        if self.store_location or (self.store_location is None and "FTIS_STORE" in os.environ):
+            from ftis.common.store import ArtifactStore
+
+            location = self.store_location if isinstance(self.store_location, (str, Path)) else None
+            self.store = ArtifactStore(location)
+
+        if self.queue_location:
+            from ftis.common.distributed import WorkQueue
+
+            self.queue = WorkQueue(self.queue_location)
 
         # Setup logging and meta path
         self.metapath = self.sink / "metadata.json"
@@ -57,6 +121,8 @@ class World:
 
     def build_connections(self, node):
         node.process = self # set the process to the world
+        if self.profile and hasattr(node, "profile"):
+            node.profile = node.profile or self.profile
         if not isinstance(node, World):
             node.create_identity()
             node.set_dump()
@@ -73,20 +139,98 @@ class World:
             self.build_connections(child)
             
         if not isinstance(node, World):
+            self.metadata["lineage"][node.identity["lineage"]] = node.identity["hash"]
             self.metadata["analyser"][node.identity["hash"]] = {
                 k: str(v) 
                 for k, v in vars(node).items() 
                 if k not in ignored_keys
             }
         
+    def index_corpus(self, corpus) -> None:
+        """Find the items that were added or changed since the previous run"""
+        corpus.create_identity()
+        try:
+            previous = self.prev_meta["corpora"][corpus.identity["lineage"]]
+        except (KeyError, TypeError):
+            previous = None
+        corpus.index = corpus.build_index(previous)
+        if previous is not None:
+            corpus.fresh = [k for k, v in corpus.index.items() if previous.get(k) != v]
+        self.metadata["corpora"][corpus.identity["lineage"]] = corpus.index
+
     def build(self, *corpora):
         self.corpora = corpora
         self.setup()
+        for c in corpora:
+            self.index_corpus(c)
         # This is a two stage process hence two loops.
         # 1: Build a graph (including depth) of connections
         for c in corpora:
             self.build_connections(c)
 
+    def estimate(self, node, workables: int) -> float:
+        """Seconds of work based on the time per workable of this node on the previous run"""
+        try:
+            previous = self.prev_meta["profile"][node.previous_run()]
+            return previous["phases"]["run"]["wall"] / previous["workables"] * workables
+        except (KeyError, TypeError, ZeroDivisionError):
+            return None
+
+    def plan_node(self, node, items: int, fresh: int, seconds: float, rows: list) -> None:
+        if any(row["hash"] == node.identity["hash"] for row in rows):
+            status, workables = "shared", 0  # an identical node earlier in the graph computes it
+        elif node.is_cached() and not fresh:
+            status, workables, fresh = "cached", 0, 0
+        elif fresh is not None and node.can_merge_previous():
+            status, workables = "incremental", fresh
+        else:
+            status, workables, fresh = "run", items, None
+
+        audio, hits = None, None
+        if isinstance(node.parent, Corpus) and status not in ("cached", "shared"):
+            # Workables can only be known up front for nodes that read the corpus directly
+            audio = seconds * workables / max(items, 1)
+            node.input = node.parent.items
+            node.adapt_input()
+            hits = sum(
+                any(node.microcache_path(w, ext).exists() for ext in (".npy", ".wav"))
+                for w in (node.workables or node.input)
+            )
+            node.input, node.workables = None, []
+
+        rows.append({
+            "node": f"{node.order}.{node.suborder}-{node.parent_string}",
+            "hash": node.identity["hash"],
+            "status": status,
+            "workables": workables,
+            "audio_seconds": audio,
+            "microcache_hits": hits,
+            "estimated_seconds": self.estimate(node, workables) if workables else 0,
+        })
+        for child in node.chain:
+            self.plan_node(child, items, fresh, seconds, rows)
+
+    def plan(self) -> list:
+        """Report which nodes run() would load from cache and how much work the rest would do"""
+        rows = []
+        for c in self.corpora:
+            seconds = sum(v["frames"] / v["samplerate"] for v in c.index.values() if v.get("samplerate"))
+            fresh = None if c.fresh is None else len(c.fresh)
+            for child in c.chain:
+                self.plan_node(child, len(c.items), fresh, seconds, rows)
+
+        if not self.quiet:
+            table = Table(title="Plan", box=box.HORIZONTALS, show_lines=True)
+            for column in ("Node", "Status", "Workables", "Audio (s)", "Microcache", "Estimate (s)"):
+                table.add_column(column)
+            for row in rows:
+                table.add_row(*[
+                    "-" if row[k] is None else (f"{row[k]:.1f}" if isinstance(row[k], float) else str(row[k]))
+                    for k in ("node", "status", "workables", "audio_seconds", "microcache_hits", "estimated_seconds")
+                ])
+            self.console.print(table)
+        return rows
+
     def run(self):
         if not self.quiet:
             version = "# **** FTIS v2.1.0a ****"
@@ -111,11 +255,102 @@ class World:
 
         self.teardown()
 
+    def walk(self, children: list, output) -> None:
+        """Pass output to the children of a node and walk them, running the variants of a sweep side by side"""
+        variants = []
+        for child in children:
+            child.input = output
+            if getattr(child, "variant", None) is None:
+                child.walk_chain()
+            else:
+                variants.append(child)
+        if variants:
+            with ThreadPoolExecutor(max_workers=self.sweep_workers or os.cpu_count()) as pool:
+                for future in [pool.submit(v.walk_chain) for v in variants]:
+                    future.result()
+
+    def sweep(self, node, grid: dict) -> list:
+        """
+        Run node once for every combination of the parameters in grid, e.g. {"numclusters": range(2, 10)}.
+        Everything before node runs once and is shared, everything after it is copied for each variant.
+        Call this after build. Returns the variants, whose outputs are available once the world has run.
+        """
+        if getattr(node, "parent", None) is None:
+            raise AnalyserParameterInvalid(f"{node.name} must be part of a built world to be swept")
+        for k in grid:
+            if not hasattr(node, k):
+                raise AnalyserParameterInvalid(f"{node.name} has no parameter {k}")
+        combinations = [dict(zip(grid, values)) for values in product(*grid.values())]
+        parent = node.parent
+        variants = [node] + [node.clone() for _ in combinations[1:]]
+        for variant, params in zip(variants, combinations):
+            variant.__dict__.update(params)
+            variant.variant = params
+            tag = "".join(f".{k}={v}" for k, v in params.items())
+            self.retag(variant, "".join(c if c.isalnum() or c in "._=-" else "_" for c in tag))
+            parent.chain[variant] = None
+            variant.parent = parent
+            variant.order = 1 if isinstance(parent, Corpus) else parent.order + 1
+            variant.suborder = list(parent.chain).index(variant)
+            self.build_connections(variant)
+        self.sweeps.append({"node": node.name, "variants": variants})
+        return variants
+
+    def retag(self, node, tag: str) -> None:
+        """Tag a variant and everything after it so their dumps do not overwrite the original ones"""
+        node.tag = tag
+        node.parent_string = node.__class__.__name__  # set_dump prefixes the parent again
+        for child in node.chain:
+            self.retag(child, tag)
+
+    def sweep_table(self) -> list:
+        """
+        One row per variant with its parameters, a summary of its result and of the results after it,
+        and the dumps holding the full outputs
+        """
+        rows = []
+        for sweep in self.sweeps:
+            for variant in sweep["variants"]:
+                results, stack = {}, [variant]
+                while stack:
+                    n = stack.pop()
+                    results[str(n.dump_path)] = n.summary() if n.output is not None else None
+                    stack.extend(n.chain)
+                rows.append(
+                    {
+                        "node": sweep["node"],
+                        "parameters": {
+                            k: v if isinstance(v, (int, float, str, bool)) else str(v)
+                            for k, v in variant.variant.items()
+                        },
+                        "hash": variant.identity["hash"],
+                        "result": results[str(variant.dump_path)],
+                        "results": results,
+                        "dumps": list(results),
+                    }
+                )
+        return rows
+
     def teardown(self):
+        if self.sweeps:
+            write_json(self.sink / "sweeps.json", self.sweep_table())
         write_json(self.metapath, self.metadata)
         if self.clear:
             self.clear_cache()
 
+    def spawn(self, process, *args) -> Future:
+        """Run process on its own thread, for streaming nodes that live as long as their parent"""
+        future = Future()
+
+        def target():
+            try:
+                future.set_result(process(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        Thread(target=target, daemon=True).start()
+        return future
+
     def fprint(self, text):
         self.console.print(text, style="yellow underline")
 
@@ -25,5 +25,10 @@ setup(
         "rich",
         "librosa",
         "jinja2",
+        "pyyaml",
+        "toml; python_version < '3.11'",
     ],
+    entry_points={
+        "console_scripts": ["ftis=ftis.cli:main"],
+    },
 )
@@ -0,0 +1,42 @@
+from ftis.common.checkpoint import Checkpoint
+
+
+def test_checkpoint_resumes_remaining(tmp_path):
+    path = tmp_path / "node.jsonl"
+    first = Checkpoint(path)
+    first["a.wav"] = [1, 2]
+    first.close()
+    with open(path, "a") as f:
+        f.write('["b.wav", [3')  # interrupted mid write
+
+    second = Checkpoint(path)
+    assert second["a.wav"] == [1, 2]
+    assert second.remaining(["a.wav", "b.wav"]) == ["b.wav"]
+    second["b.wav"] = [3]
+    second.close()
+    assert len(Checkpoint(path)) == 2
+    second.close(completed=True)
+    assert not path.exists()
+
+
+def test_checkpoint_drops_stale_results(tmp_path):
+    checkpoint = Checkpoint(tmp_path / "node.jsonl")
+    checkpoint["gone.wav"] = 1
+    assert checkpoint.remaining(["new.wav"]) == ["new.wav"]
+    assert "gone.wav" not in checkpoint
+
+
+def test_arrays_are_journalled_in_binary(tmp_path):
+    import numpy as np
+
+    path = tmp_path / "node.jsonl"
+    first = Checkpoint(path)
+    frames = np.arange(6, dtype=np.float32).reshape(2, 3)
+    first["a.wav"] = frames
+    first.close()
+    assert "[[" not in path.read_text()
+
+    second = Checkpoint(path)
+    assert second["a.wav"].dtype == np.float32 and np.array_equal(second["a.wav"], frames)
+    second.close(completed=True)
+    assert not path.exists() and not path.with_suffix(".arrays").exists()
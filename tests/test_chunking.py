@@ -0,0 +1,53 @@
+import numpy as np
+from ftis.common.chunking import split, gather
+
+
+def frame_positions(workable, hop):
+    """Stand in analysis whose frames record the sample they start on"""
+    start = workable["startframe"]
+    return np.arange(start, start + workable["numframes"], hop)
+
+
+def test_stitched_chunks_match_whole_file():
+    frames, hop = 100000, 512
+    whole = {"file": "a.wav", "id": "a.wav", "startframe": 0, "numframes": frames}
+    chunks = split(whole, frames, hop, window=2048, chunksize=8000)
+    assert len(chunks) > 1
+
+    results = {c["id"]: frame_positions(c, hop) for c in chunks}
+    stitched = gather(results, chunks)["a.wav"]
+    assert np.array_equal(stitched, frame_positions(whole, hop))
+
+
+def test_short_workables_are_left_whole():
+    w = {"file": "a.wav", "id": "a.wav", "startframe": 0, "numframes": -1}
+    assert split(w, 1000, 512, 2048, 8000) == [w]
+
+
+def test_streams_only_see_stitched_files(tmp_path):
+    from types import SimpleNamespace
+    from ftis.common.analyser import FTISAnalyser
+    from ftis.common.stream import Stream
+
+    class Frames(FTISAnalyser):
+        def adapt_input(self):
+            whole = [{"file": "a.wav", "id": "a.wav", "startframe": 0, "numframes": -1}]
+            self.workables = self.split_workables(whole, 512, 2048)
+
+        def run(self):
+            self.buffer = self.checkpoint()
+            for w in self.buffer.remaining(self.workables, key=self.workable_key):
+                self.buffer[w["id"]] = frame_positions(w, 512)
+            self.output = gather(dict(self.buffer), self.workables)
+
+    node = Frames()
+    node.process = SimpleNamespace(split=1, checkpoints=tmp_path, fprint=print)
+    node.parent = SimpleNamespace(index={"a.wav": {"frames": 100000, "samplerate": 8000}})
+    node.identity["lineage"] = "abc"
+    stream = Stream()
+    node.streams = {"child": stream}
+    node.process_items()
+    stream.close()
+    assert len(node.workables) > 1
+    assert list(stream) == ["a.wav"]
+    assert np.array_equal(stream["a.wav"], node.output["a.wav"])
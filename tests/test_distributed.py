@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+from ftis.common.distributed import WorkQueue, execute
+
+
+class Square:
+    def __init__(self):
+        self.identity = {"hash": "abc"}
+        self.process = SimpleNamespace(sink="/tmp", cache="/tmp", workers=None)
+        self.buffer = {}
+
+    def analyse(self, workable):
+        self.buffer[str(workable)] = workable**2
+
+
+def test_queue_round_trip(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.db")
+    node = Square()
+    job = queue.submit(node, "analyse", [1, 2, 3])
+    while (claimed := queue.claim(job)) is not None:
+        execute(queue, job, claimed[0], claimed[2], node.analyse)
+    assert queue.progress(job) == {"done": 3}
+    merged = {k: v for r in queue.results(job) for k, v in r.items()}
+    assert merged == {"1": 1, "2": 4, "3": 9}
+
+    # finished work survives being submitted again
+    queue.submit(node, "analyse", [2, 3, 4])
+    assert queue.progress(job) == {"done": 2, "pending": 1}
+
+
+def test_expired_claims_fail_after_all_attempts(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.db", lease=0, attempts=2)
+    job = queue.submit(Square(), "analyse", [1])
+    assert queue.claim(job) is not None
+    assert queue.claim(job) is not None  # the first claim expired and is handed out again
+    assert queue.claim(job) is None
+    assert queue.progress(job) == {"failed": 1}
+    assert queue.errors(job) == ["claim expired after 2 attempts"]
+
+
+def test_worker_finds_the_microcache_of_the_coordinator(tmp_path):
+    import wave
+    import numpy as np
+    from ftis.world import World
+    from ftis.corpus import Corpus
+    from ftis.analyser.descriptor import Flux
+
+    audio = tmp_path / "audio"
+    audio.mkdir()
+    with wave.open(str(audio / "a.wav"), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(44100)
+        f.writeframes(bytes(200))
+    world = World(sink=tmp_path / "sink", quiet=True)
+    src = Corpus(audio)
+    node = src >> Flux()
+    world.build(src)
+    node.input = src.items
+    node.adapt_input()
+    np.save(node.microcache_path(node.workables[0]), np.ones(4))  # so the worker needs no audio stack
+
+    queue = WorkQueue(tmp_path / "queue.db")
+    job = queue.submit(node, "flux", node.workables)
+    task, _, workable = queue.claim(job)
+    execute(queue, job, task, workable, queue.load(job))
+    assert queue.errors(job) == []
+    [result] = queue.results(job)
+    assert np.array_equal(result[workable["id"]], np.ones(4))
@@ -0,0 +1,13 @@
+from ftis.common.utils import find_duplicates
+
+
+def test_find_duplicates(tmp_path):
+    for name, content in (
+        ("a.wav", b"x" * 100),
+        ("b.wav", b"x" * 100),
+        ("c.wav", b"y" * 100),
+        ("d.wav", b"x"),
+    ):
+        (tmp_path / name).write_bytes(content)
+    paths = sorted(str(p) for p in tmp_path.iterdir())
+    assert find_duplicates(paths) == {paths[0]: [paths[1]]}
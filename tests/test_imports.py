@@ -0,0 +1,10 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from imports import MODULES, probe
+
+
+def test_heavy_dependencies_are_lazy():
+    for module in MODULES:
+        assert probe(module)["eager"] == [], module
@@ -0,0 +1,77 @@
+import numpy as np
+from ftis.index import NeighbourIndex, NeighbourGraph
+
+
+def test_query_returns_keys():
+    keys = ["a.wav", "b.wav", "c.wav"]
+    data = [[0.0, 0.0], [1.0, 1.0], [5.0, 5.0]]
+    index = NeighbourIndex(keys, data)
+    nearest = index.query([[0.9, 0.9]], k=2)[0]
+    assert [k for k, _ in nearest] == ["b.wav", "a.wav"]
+
+
+def test_radius():
+    keys = ["a.wav", "b.wav", "c.wav"]
+    data = [[0.0, 0.0], [1.0, 1.0], [5.0, 5.0]]
+    index = NeighbourIndex(keys, data)
+    within = index.radius([[0.0, 0.0]], 2.0)[0]
+    assert [k for k, _ in within] == ["a.wav", "b.wav"]
+
+
+def test_add_and_remove_without_rebuild():
+    index = NeighbourIndex(["a.wav", "b.wav"], [[0.0, 0.0], [1.0, 1.0]], threshold=10)
+    index.add(["c.wav"], [[0.1, 0.1]])
+    index.remove(["a.wav"])
+    assert index.built == 2
+    assert [k for k, _ in index.query([[0.0, 0.0]], k=2)[0]] == ["c.wav", "b.wav"]
+
+
+def test_rebuild_past_threshold():
+    index = NeighbourIndex(["a.wav", "b.wav"], [[0.0, 0.0], [1.0, 1.0]], threshold=0.4)
+    index.add(["c.wav"], [[0.1, 0.1]])
+    assert index.built == 3
+    assert len(index) == 3
+
+
+def test_neighbour_graph_matches_kneighbors_graph(tmp_path):
+    from sklearn.neighbors import kneighbors_graph
+
+    data = np.random.default_rng(0).random((50, 3)).astype(np.float32)
+    graph = NeighbourGraph.build(data, 6)
+    assert (graph.connectivity(5) != kneighbors_graph(data, n_neighbors=5, include_self=False)).nnz == 0
+
+    graph.save(tmp_path / "graph.npz")
+    loaded = NeighbourGraph.load(tmp_path / "graph.npz")
+    assert loaded.k == 6 and np.array_equal(loaded.indices, graph.indices)
+
+
+def test_a_failed_graph_build_is_retried_by_the_next_node(tmp_path, monkeypatch):
+    import pytest
+    from threading import Lock
+    from types import SimpleNamespace
+    from ftis.common.analyser import FTISAnalyser
+
+    process = SimpleNamespace(graphs={}, lock=Lock(), cache=tmp_path)
+    first, second = FTISAnalyser(), FTISAnalyser()
+    first.process = second.process = process
+    data = np.random.default_rng(0).random((50, 3)).astype(np.float32)
+
+    def fail(*args):
+        raise MemoryError
+
+    monkeypatch.setattr(NeighbourGraph, "build", fail)
+    with pytest.raises(MemoryError):
+        first.neighbour_graph(data, 5)
+    monkeypatch.undo()
+    assert second.neighbour_graph(data, 5).k >= 5
+
+
+def test_approximate_radius_matches_exact():
+    rng = np.random.default_rng(0)
+    data = rng.random((200, 4)).astype(np.float32)
+    keys = [f"{i}.wav" for i in range(200)]
+    points = [[0.5] * 4, data[0]]
+    exact = NeighbourIndex(keys, data).radius(points, 0.4)
+    approximate = NeighbourIndex(keys, data, approximate=True).radius(points, 0.4)
+    assert [{k for k, _ in r} for r in approximate] == [{k for k, _ in r} for r in exact]
+    assert max(len(r) for r in exact) > 16  # k had to grow past its first guess
@@ -0,0 +1,142 @@
+import wave
+from ftis.common.analyser import FTISAnalyser
+
+
+def one_file_corpus(tmp_path):
+    """A folder holding one short silent wav file"""
+    audio = tmp_path / "audio"
+    audio.mkdir()
+    with wave.open(str(audio / "a.wav"), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(44100)
+        f.writeframes(bytes(200))
+    return audio
+
+
+def test_identical_nodes_share_one_computation(tmp_path):
+    from ftis.world import World
+    from ftis.corpus import Corpus
+
+    class Count(FTISAnalyser):
+        runs = 0
+
+        def run(self):
+            Count.runs += 1
+            self.output = {str(x): 1 for x in self.input}
+
+    class Files(FTISAnalyser):
+        def run(self):
+            self.output = list(self.input)
+
+    audio = one_file_corpus(tmp_path)
+
+    world = World(sink=tmp_path / "sink", quiet=True)
+    src = Corpus(audio)
+    files = src >> Files()
+    first, second, hooked = Count(), Count(), Count(post=lambda node: None)
+    files >> first
+    files >> second
+    files >> hooked  # a hook can change what a node computes, so it is never reused
+    world.build(src)
+    world.run()
+    assert Count.runs == 2
+    assert first.output is second.output
+    assert first.dump_path != second.dump_path
+
+
+def test_clone_copies_everything_after_a_node():
+    node = FTISAnalyser()
+    child = FTISAnalyser()
+    node >> child
+    copy = node.clone(numclusters=4)
+    assert copy.numclusters == 4 and not hasattr(node, "numclusters")
+    assert len(copy.chain) == 1 and next(iter(copy.chain)) is not child
+
+
+def test_microcache_misses_when_the_source_changes(tmp_path):
+    from types import SimpleNamespace
+
+    node = FTISAnalyser()
+    node.process = SimpleNamespace(cache=tmp_path)
+    node.identity["lineage"] = "abc"
+    audio = tmp_path / "a.wav"
+    audio.write_bytes(b"1")
+    before = node.microcache_path(str(audio))
+    audio.write_bytes(b"22")
+    assert node.microcache_path(str(audio)) != before
+
+
+def test_workable_timings_live_outside_the_metadata(tmp_path):
+    from threading import Lock
+    from types import SimpleNamespace
+
+    node = FTISAnalyser()
+    node.process = SimpleNamespace(timings=tmp_path, metadata={"timings": {}}, lock=Lock(), prev_meta=None)
+    node.identity["lineage"] = "abc"
+    node.timings = {"a.wav": 2.0, "b.wav": 1.0}
+    node.frames = {"a.wav": 200, "b.wav": 100}
+    node.record_timings()
+    assert node.process.metadata["timings"]["abc"] == {"rate": 0.01, "total": 3.0, "workables": 2}
+    node.process.prev_meta = node.process.metadata
+    assert node.previous_timings()["seconds"] == {"a.wav": 2.0, "b.wav": 1.0}
+
+
+def test_sweep_table_pairs_parameters_with_results(tmp_path):
+    from ftis.world import World
+    from ftis.corpus import Corpus
+    from ftis.common.io import read_json
+
+    class Repeat(FTISAnalyser):
+        def __init__(self, times=1):
+            super().__init__()
+            self.times = times
+
+        def run(self):
+            self.output = list(self.input) * self.times
+
+    audio = one_file_corpus(tmp_path)
+
+    world = World(sink=tmp_path / "sink", quiet=True)
+    src = Corpus(audio)
+    node = src >> Repeat()
+    world.build(src)
+    world.sweep(node, {"times": [1, 3]})
+    world.run()
+    rows = read_json(world.sink / "sweeps.json")
+    assert [(r["parameters"], r["result"]) for r in rows] == [
+        ({"times": 1}, {"items": 1}),
+        ({"times": 3}, {"items": 3}),
+    ]
+
+
+def test_cached_child_of_a_node_that_always_runs_is_loaded(tmp_path):
+    from ftis.world import World
+    from ftis.corpus import Corpus
+    from ftis.common.io import read_json, write_json
+
+    class Files(FTISAnalyser):
+        def run(self):
+            self.output = [str(x) for x in self.input]
+
+    class Count(FTISAnalyser):
+        runs = 0
+
+        def load_cache(self):
+            self.output = read_json(self.dump_path)
+
+        def dump(self):
+            write_json(self.dump_path, self.output)
+
+        def run(self):
+            Count.runs += 1
+            self.output = {x: 1 for x in self.input}
+
+    audio = one_file_corpus(tmp_path)
+    for _ in range(2):
+        world = World(sink=tmp_path / "sink", quiet=True)
+        src = Corpus(audio)
+        src >> Files(cache=False) >> Count(cache=True)
+        world.build(src)
+        world.run()
+    assert Count.runs == 1
@@ -0,0 +1,30 @@
+import time
+from ftis.common.prefetch import Prefetcher
+
+
+def test_prefetcher_stays_ahead_by_a_bounded_amount():
+    loaded = []
+
+    def load(x):
+        loaded.append(x)
+        return [x]
+
+    pool = Prefetcher(range(10), load, str, ahead=2)
+    pool.start()
+    time.sleep(0.1)
+    assert loaded == [0, 1]
+    assert pool.take("0") == [0]
+    assert pool.take("5") is None  # not reached yet, the worker loads it itself
+    time.sleep(0.1)
+    pool.stop()
+    assert 5 not in loaded
+    assert loaded[:3] == [0, 1, 2]
+
+
+def test_warming_does_not_stall_on_files_nobody_takes():
+    warmed = []
+    pool = Prefetcher(range(10), warmed.append, str, ahead=2)
+    pool.start()
+    pool.join(timeout=1)
+    assert warmed == list(range(10))
+    assert pool.warmed == 10 and not pool.ready
@@ -0,0 +1,38 @@
+from threading import Lock
+from ftis.common.proc import imap
+
+
+def test_imap_bounds_work_in_flight():
+    import time
+
+    window, chunksize = 3, 2
+    lock = Lock()
+    state = {"produced": 0, "finished": 0, "peak": 0}
+
+    def produce():
+        for x in range(100):
+            with lock:
+                state["produced"] += 1
+                state["peak"] = max(state["peak"], state["produced"] - state["finished"])
+            yield x
+
+    def square(x):
+        time.sleep(0.002)  # workers are slower than the producer
+        with lock:
+            state["finished"] += 1
+        return x * x
+
+    results = imap(square, produce(), workers=2, window=window, chunksize=chunksize)
+    first = next(results)
+    assert state["produced"] <= (window + 1) * chunksize  # pulled lazily, not all at once
+    assert sorted([first, *results]) == [x * x for x in range(100)]
+    # chunks submitted and not finished, plus the one being filled before it can be submitted
+    assert state["peak"] <= (window + 1) * chunksize
+
+
+def test_expensive_workables_are_not_batched():
+    from ftis.common.proc import chunked
+
+    costs = [100, 50, 1, 1, 1, 1]
+    chunks = list(chunked(range(6), 64, costs, budget=10))
+    assert chunks == [[0], [1], [2, 3, 4, 5]]
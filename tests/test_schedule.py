@@ -0,0 +1,13 @@
+from ftis.common.analyser import FTISAnalyser
+
+
+def test_schedule_keeps_slices_of_a_file_together():
+    node = FTISAnalyser()
+    workables = [
+        {"file": "a.wav", "id": "a.wav_1", "startframe": 100, "numframes": 100},
+        {"file": "b.wav", "id": "b.wav_0", "startframe": 0, "numframes": 150},
+        {"file": "a.wav", "id": "a.wav_0", "startframe": 0, "numframes": 100},
+    ]
+    ordered, costs = node.schedule(workables)
+    assert [w["id"] for w in ordered] == ["a.wav_0", "a.wav_1", "b.wav_0"]
+    assert costs == [100, 100, 150]
@@ -0,0 +1,24 @@
+from ftis.common.store import ArtifactStore, input_fingerprint
+
+
+def test_publish_and_fetch(tmp_path):
+    store = ArtifactStore(tmp_path / "store")
+    output = tmp_path / "a" / "1.0-Corpus.json"
+    output.parent.mkdir()
+    output.write_text("{}")
+    assert store.publish("abcdef", {"output": output, "model": None})
+    assert not store.publish("abcdef", {"output": output})
+
+    fetched = tmp_path / "b" / "1.0-Corpus.json"
+    assert store.fetch("abcdef", {"output": fetched, "model": tmp_path / "b" / "model.joblib"})
+    assert fetched.read_text() == "{}"
+    assert not (tmp_path / "b" / "model.joblib").exists()
+    assert not store.fetch("123456", {"output": fetched})
+
+
+def test_input_fingerprint_follows_the_index():
+    index = {"a.wav": {"size": 1, "mtime": 1.0}}
+    assert input_fingerprint(["a.wav"], index) != input_fingerprint(
+        ["a.wav"], {"a.wav": {"size": 2, "mtime": 1.0}}
+    )
+    assert input_fingerprint({"a.wav": [1, 2]}) == input_fingerprint({"a.wav": [1, 2]})
@@ -0,0 +1,25 @@
+import pytest
+from threading import Thread
+from ftis.common.stream import Stream
+from ftis.common.exceptions import StreamAborted
+
+
+def test_stream_yields_while_producing():
+    stream = Stream(size=2)
+
+    def produce():
+        for i in range(10):
+            stream.put(str(i), i)
+        stream.close()
+
+    Thread(target=produce).start()
+    assert [stream[k] for k in stream] == list(range(10))
+    assert len(stream) == 10
+
+
+def test_failed_parent_aborts_stream():
+    stream = Stream()
+    stream.put("a", 1)
+    stream.close(failed=True)
+    with pytest.raises(StreamAborted):
+        list(stream)
@@ -0,0 +1,66 @@
+from ftis.common.types import Data, item_keys, subset, fan_out, fold_in
+
+
+def test_subset_keeps_container_type():
+    data = Data({"a.wav": [1], "b.wav": [2]})
+    kept = subset(data, {"b.wav"})
+    assert isinstance(kept, Data)
+    assert item_keys(kept) == ["b.wav"]
+
+
+def test_subset_of_list():
+    assert subset(["a.wav", "b.wav"], {"a.wav"}) == ["a.wav"]
+
+
+def test_feature_store_round_trip(tmp_path):
+    import numpy as np
+    from ftis.common.types import FeatureStore
+
+    store = FeatureStore({"a.wav": [[1, 2, 3], [4, 5, 6]], "b.wav": [7.5]})
+    assert store.buffer.dtype == np.float32 and store.buffer.size == 7
+    assert np.shares_memory(store["a.wav"], store.buffer)
+    store.save(tmp_path / "features.npz")
+
+    loaded = FeatureStore.load(tmp_path / "features.npz")
+    assert list(loaded.keys()) == ["a.wav", "b.wav"]
+    assert loaded["a.wav"].shape == (2, 3)
+    assert isinstance(subset(loaded, {"b.wav"}), FeatureStore)
+
+
+def test_fan_out_to_aliases():
+    aliases = {"a.wav": ["b.wav"]}
+    output = {"a.wav_0": [1, 2], "c.wav_0": [3], "clusters": ["a.wav", "c.wav"]}
+    fanned = fan_out(output, aliases)
+    assert fanned["b.wav_0"] == [1, 2]
+    assert fanned["clusters"] == ["a.wav", "c.wav", "b.wav"]
+    assert fold_in(fanned, aliases) == output
+
+
+def test_fan_out_keeps_compact_labels_aligned():
+    aliases = {"a.wav": ["b.wav"]}
+    output = {"keys": ["a.wav", "c.wav"], "labels": [0, 1]}
+    fanned = fan_out(output, aliases)
+    assert fanned == {"keys": ["a.wav", "c.wav", "b.wav"], "labels": [0, 1, 0]}
+    assert fold_in(fanned, aliases) == output
+
+
+def test_fan_out_leaves_data_lists_alone():
+    aliases = {"a.wav": ["b.wav"]}
+    output = {"a.wav": [[0.5, 1.0]], "names": ["a.wav", 3]}
+    fanned = fan_out(output, aliases)
+    assert fanned == {"a.wav": [[0.5, 1.0]], "b.wav": [[0.5, 1.0]], "names": ["a.wav", 3]}
+    assert fold_in(fanned, aliases) == output
+
+
+def test_aliases_follow_collapsed_copies(tmp_path):
+    from types import SimpleNamespace
+    from ftis.common.analyser import FTISAnalyser
+    from ftis.analyser.audio import CollapseAudio
+
+    collapse = CollapseAudio()
+    collapse.process = SimpleNamespace(store=None, sink=tmp_path)
+    collapse.parent = SimpleNamespace(aliases={"/corpus/a.wav": ["/corpus/copy/b.wav"]})
+    child = FTISAnalyser()
+    child.parent = collapse
+    folder = collapse.folder()
+    assert child.aliases() == {str(folder / "a.wav"): [str(folder / "b.wav")]}